@@ -0,0 +1,130 @@
+# broadcast.py
+# ارسال یک پیام به تعداد زیادی چت (اطلاع‌رسانی ادمین) با سقف هم‌زمانی و سقف نرخ،
+# تا سهمیه‌ی Bot API برای پیام‌های خود بازی باقی بماند.
+import asyncio
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Iterable, Optional
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+import metrics
+
+Send = Callable[[int], Awaitable[object]]
+Progress = Callable[[dict], Awaitable[object]]
+
+
+class RateLimiter:
+    """حداکثر rate درخواست در ثانیه (بین همه‌ی taskها)؛ با RetryAfter همه با هم صبر می‌کنند."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next = time.monotonic()
+
+    async def acquire(self):
+        now = time.monotonic()
+        slot = max(now, self._next)
+        self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def pause(self, seconds: float):
+        self._next = max(self._next, time.monotonic() + seconds)
+
+
+def _seconds(value) -> float:
+    # retry_after در نسخه‌های جدید PTB ممکن است timedelta باشد
+    return float(value.total_seconds() if hasattr(value, "total_seconds") else value)
+
+
+class BatchSender:
+    """send(chat_id) را برای همه‌ی چت‌ها با concurrency کارگر و نرخ rate صدا می‌زند.
+
+    RetryAfter کل ارسال را به اندازه‌ی خواسته‌شده متوقف و همان چت را دوباره امتحان می‌کند؛
+    Forbidden/BadRequest (ربات حذف شده، چت پیدا نشد) خطای قطعی است و تکرار نمی‌شود.
+    """
+
+    def __init__(self, send: Send, rate: float = 20.0, concurrency: int = 8, retries: int = 3,
+                 progress: Optional[Progress] = None, progress_every: float = 5.0):
+        self.send = send
+        self.limiter = RateLimiter(rate)
+        self.concurrency = concurrency
+        self.retries = retries
+        self.progress = progress
+        self.progress_every = progress_every
+        self.total = self.delivered = self.failed = 0
+        self.errors: Counter = Counter()
+        self.started = 0.0
+        self._stopped = False
+
+    def stop(self):
+        self._stopped = True
+
+    def report(self) -> dict:
+        return {
+            "total": self.total,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "pending": self.total - self.delivered - self.failed,
+            "errors": dict(self.errors),
+            "seconds": round(time.monotonic() - self.started, 1),
+            "stopped": self._stopped,
+        }
+
+    async def _send_one(self, chat_id: int):
+        attempt = 0
+        while not self._stopped:
+            await self.limiter.acquire()
+            try:
+                await self.send(chat_id)
+                self.delivered += 1
+                return
+            except RetryAfter as e:
+                self.limiter.pause(_seconds(e.retry_after))
+                self.errors["RetryAfter"] += 1
+                continue
+            except (Forbidden, BadRequest) as e:
+                self.errors[type(e).__name__] += 1
+                break
+            except NetworkError as e:
+                self.errors[type(e).__name__] += 1
+                attempt += 1
+                if attempt > self.retries:
+                    break
+                await asyncio.sleep(min(2 ** attempt, 30))
+            except Exception as e:
+                self.errors[type(e).__name__] += 1
+                break
+        else:
+            return  # متوقف شد؛ در گزارش جزو pending می‌ماند
+        self.failed += 1
+
+    async def _worker(self, queue: asyncio.Queue):
+        while not self._stopped:
+            try:
+                chat_id = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await self._send_one(chat_id)
+
+    async def _report_loop(self):
+        while True:
+            await asyncio.sleep(self.progress_every)
+            try:
+                await self.progress(self.report())
+            except Exception:
+                metrics.swallowed()
+
+    async def run(self, chat_ids: Iterable[int]) -> dict:
+        queue: asyncio.Queue = asyncio.Queue()
+        for cid in chat_ids:
+            queue.put_nowait(cid)
+        self.total = queue.qsize()
+        self.started = time.monotonic()
+        reporter = asyncio.create_task(self._report_loop()) if self.progress else None
+        try:
+            await asyncio.gather(*(self._worker(queue) for _ in range(min(self.concurrency, self.total) or 1)))
+        finally:
+            if reporter:
+                reporter.cancel()
+        return self.report()
@@ -0,0 +1,126 @@
+# export.py
+# خروجی stream از امتیازات، جدول امتیاز هر گروه و رویدادهای بازی به CSV یا JSONL (اختیاری gzip).
+# سطرها مستقیم از cursor دیتابیس نوشته می‌شوند، پس حافظه با حجم داده زیاد نمی‌شود.
+#
+#   python3 export.py scores                                   # CSV روی stdout
+#   python3 export.py leaderboards --format jsonl -o boards.jsonl.gz
+#   python3 export.py events --chat -100123 --since 2026-01-01
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, Optional, Tuple
+
+from store import ScoreStore, StatsStore
+
+KINDS = ("scores", "leaderboards", "events")
+FORMATS = ("csv", "jsonl")
+COLUMNS = {
+    "scores": ("uid", "score"),
+    "leaderboards": ("chat_id", "uid", "score") + StatsStore.FIELDS,
+    "events": ("time", "chat_id", "uid", "kind", "resp_ms"),
+}
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat(timespec="milliseconds")
+
+
+def rows(kind: str, db: str, chat_id=None, since: float = 0,
+         points: Tuple[int, int, int] = (1, 2, -1)) -> Iterator[tuple]:
+    """سطرهای یک نوع خروجی، مستقیم از cursor دیتابیس."""
+    if kind == "scores":
+        return ScoreStore(db).iter_all()
+    stats = StatsStore(db)
+    if kind == "leaderboards":
+        return stats.iter_leaderboards(chat_id, *points)
+    return ((_iso(ts), chat, uid, k, ms) for ts, chat, uid, k, ms in stats.iter_events(chat_id, since))
+
+
+def write(out, kind: str, data: Iterable[tuple], fmt: str = "csv", compress: bool = False) -> int:
+    """data را در فایل باینری out می‌نویسد و تعداد سطرها را برمی‌گرداند؛ out بسته نمی‌شود."""
+    raw = gzip.GzipFile(fileobj=out, mode="wb") if compress else out
+    # BOM برای CSV تا اکسل متن فارسی را درست نشان دهد
+    text = io.TextIOWrapper(raw, encoding="utf-8-sig" if fmt == "csv" else "utf-8", newline="")
+    columns = COLUMNS[kind]
+    n = 0
+    try:
+        if fmt == "csv":
+            w = csv.writer(text)
+            w.writerow(columns)
+            for row in data:
+                w.writerow(row)
+                n += 1
+        else:
+            for row in data:
+                text.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n")
+                n += 1
+        text.flush()
+    finally:
+        text.detach()
+        if compress:
+            raw.close()
+    return n
+
+
+def filename(kind: str, fmt: str, compress: bool) -> str:
+    return f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}.{fmt}" + (".gz" if compress else "")
+
+
+def export_file(kind: str, db: str, fmt: str = "csv", compress: bool = False, chat_id=None,
+                since: float = 0, points: Tuple[int, int, int] = (1, 2, -1), directory: Optional[str] = None):
+    """خروجی را در یک فایل موقت می‌نویسد و (مسیر, تعداد سطر) را برمی‌گرداند؛ حذف فایل با صدازننده است.
+
+    بلاک‌کننده است؛ main.py آن را در ترد جدا اجرا می‌کند (نه IO_EXECUTOR تا ذخیره‌ی state عقب نیفتد).
+    """
+    fd, path = tempfile.mkstemp(prefix=f"export-{kind}-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            n = write(out, kind, rows(kind, db, chat_id, since, points), fmt, compress)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, n
+
+
+def _since(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp()
+
+
+def cli():
+    import main
+
+    parser = argparse.ArgumentParser(description="stream scores, leaderboards or game events as CSV/JSONL")
+    parser.add_argument("kind", choices=KINDS)
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--gzip", action="store_true", help="فشرده‌سازی (اگر -o به .gz ختم شود خودکار)")
+    parser.add_argument("-o", "--output", help="فایل خروجی (پیش‌فرض stdout)")
+    parser.add_argument("--chat", type=int, help="فقط یک گروه (leaderboards/events)")
+    parser.add_argument("--since", type=_since, default=0, help="events از این زمان (epoch یا ISO مثل 2026-01-01)")
+    parser.add_argument("--db", default=main.SCORE_DB)
+    args = parser.parse_args()
+
+    compress = args.gzip or bool(args.output and args.output.endswith(".gz"))
+    data = rows(args.kind, args.db, args.chat, args.since,
+                (main.SCORE_TRUTH, main.SCORE_DARE, main.PENALTY_NO_ANSWER))
+    if args.output:
+        with open(args.output, "wb") as out:
+            n = write(out, args.kind, data, args.format, compress)
+    else:
+        n = write(sys.stdout.buffer, args.kind, data, args.format, compress)
+        sys.stdout.buffer.flush()
+    print(f"{n} rows", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -0,0 +1,415 @@
+# loadtest.py
+# تست بار مصنوعی: N گروه با M بازیکن که با زمان فکر تصادفی دکمه‌ها را می‌زنند.
+# ربات واقعی (Application + هندلرهای main.py) به یک Bot API محلی جعلی وصل می‌شود.
+#
+#   python3 loadtest.py --groups 200 --players 5 --duration 60 --json bench_output.json
+#   python3 loadtest.py ... --baseline old_bench.json
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import httpx
+from telegram import Update
+from telegram.ext import ApplicationBuilder, TypeHandler
+
+import main
+import metrics as bot_metrics
+from metrics import percentile
+
+FAKE_TOKEN = "123456:LOADTEST"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "loadtest", "username": "loadtest_bot"}
+
+# ---------- Bot API جعلی (در یک پروسه‌ی جدا، تا روی event loop ربات اثر نگذارد) ----------
+def _api_result(method: str, params: dict, next_id):
+    def _int(name, default=0):
+        try:
+            return int(params.get(name, default))
+        except Exception:
+            return default
+
+    if method == "getMe":
+        return BOT_USER
+    if method in ("sendMessage", "sendDocument", "editMessageText"):
+        chat_id = _int("chat_id")
+        return {
+            "message_id": _int("message_id") or next_id(),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup" if chat_id < 0 else "private"},
+            "from": BOT_USER,
+            "text": params.get("text", ""),
+        }
+    if method == "getChatMember":
+        uid = _int("user_id")
+        return {"status": "member", "user": {"id": uid, "is_bot": False, "first_name": f"u{uid}"}}
+    if method == "getChatAdministrators":
+        return []
+    return True
+
+
+def serve_fake_api(port_queue, latency: float):
+    calls = defaultdict(int)
+    lock = threading.Lock()
+    counter = [0]
+
+    def next_id():
+        with lock:
+            counter[0] += 1
+            return counter[0]
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            with lock:
+                self._reply(dict(calls))
+
+        def do_POST(self):
+            method = self.path.rstrip("/").rsplit("/", 1)[-1]
+            raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            params = {}
+            try:
+                if "json" in (self.headers.get("Content-Type") or ""):
+                    params = json.loads(raw or b"{}")
+                else:
+                    params = {k: v[0] for k, v in parse_qs(raw.decode("utf-8", "replace")).items()}
+            except Exception:
+                pass
+            with lock:
+                calls[method] += 1
+            if latency:
+                time.sleep(latency)
+            self._reply({"ok": True, "result": _api_result(method, params, next_id)})
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+# ---------- ساخت آپدیت‌های مصنوعی ----------
+class UpdateFactory:
+    def __init__(self, bot):
+        self.bot = bot
+        self.next_id = 1
+
+    def _user(self, uid):
+        return {"id": uid, "is_bot": False, "first_name": f"u{uid}"}
+
+    def _chat(self, chat_id):
+        return {"id": chat_id, "type": "supergroup", "title": f"g{chat_id}"}
+
+    def command(self, chat_id, uid, text):
+        self.next_id += 1
+        return Update.de_json({
+            "update_id": self.next_id,
+            "message": {
+                "message_id": self.next_id, "date": int(time.time()),
+                "chat": self._chat(chat_id), "from": self._user(uid), "text": text,
+                "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}],
+            },
+        }, self.bot)
+
+    def callback(self, chat_id, uid, data, message_id=0):
+        self.next_id += 1
+        return Update.de_json({
+            "update_id": self.next_id,
+            "callback_query": {
+                "id": str(self.next_id), "chat_instance": str(chat_id), "from": self._user(uid), "data": data,
+                "message": {"message_id": message_id, "date": int(time.time()), "chat": self._chat(chat_id)},
+            },
+        }, self.bot)
+
+
+# ---------- اندازه‌گیری‌ها ----------
+class Metrics:
+    def __init__(self):
+        self.pending = {}                    # update_id -> (enqueue time, future)
+        self.update_latency = []
+        self.processed = 0
+        self.turn_pressed = {}               # chat_id -> زمان زدن resp
+        self.turn_latency = []
+        self.timeout_turn_latency = []       # تعویض نوبت توسط واچر مهلت (بدون زدن دکمه)
+        self.starting = set()                # chat_idهایی که اولین نوبتشان با /startgame است
+        self.turns = 0
+        self.loop_lag = []
+        self.rss = []
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def instrument(metrics: Metrics):
+    """do_next_turn را در ماژول main برای اندازه‌گیری زمان تعویض نوبت می‌پوشاند."""
+    real_next_turn = main.do_next_turn
+
+    async def do_next_turn(chat_id, context):
+        t0 = time.perf_counter()
+        await real_next_turn(chat_id, context)
+        metrics.turns += 1
+        pressed = metrics.turn_pressed.pop(chat_id, None)
+        if pressed is not None:
+            metrics.turn_latency.append(time.perf_counter() - pressed)
+        elif chat_id in metrics.starting:
+            metrics.starting.discard(chat_id)
+        else:
+            metrics.timeout_turn_latency.append(time.perf_counter() - t0)
+
+    main.do_next_turn = do_next_turn
+
+
+async def lag_monitor(metrics: Metrics, interval: float = 0.05):
+    while True:
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        metrics.loop_lag.append(max(0.0, time.perf_counter() - t0 - interval))
+
+
+async def memory_monitor(metrics: Metrics, interval: float = 1.0):
+    while True:
+        metrics.rss.append(rss_bytes())
+        await asyncio.sleep(interval)
+
+
+# ---------- شبیه‌سازی یک گروه ----------
+async def play_group(app, factory, metrics, gi, n_players, deadline, think, p_change, p_refuse, p_afk, rng):
+    chat_id = -1000000000000 - gi
+    pids = [10_000_000 + gi * 1000 + j for j in range(n_players)]
+
+    async def send(update):
+        fut = asyncio.get_running_loop().create_future()
+        metrics.pending[update.update_id] = (time.perf_counter(), fut)
+        await app.update_queue.put(update)
+        await fut
+
+    async def pause():
+        await asyncio.sleep(rng.uniform(*think))
+
+    for pid in pids:
+        await send(factory.command(chat_id, pid, "/join"))
+        await pause()
+    metrics.starting.add(chat_id)
+    await send(factory.command(chat_id, int(main.ADMIN_ID), "/startgame"))
+
+    while time.perf_counter() < deadline:
+        await pause()
+        g = main.state.get("games", {}).get(str(chat_id))
+        if not g or not g.get("started"):
+            break
+        try:
+            cur = g["players"][g["idx"]]
+        except Exception:
+            continue
+        if not g.get("awaiting"):
+            continue
+        if rng.random() < p_afk:
+            # بازیکن غایب: واچر بعد از مهلت (تطبیقی) همین نوبت آن را رد می‌کند
+            await asyncio.sleep(g.get("turn_timeout", main.TURN_TIMEOUT))
+            continue
+        if not g.get("current_question"):
+            kind = rng.choice(("truth", "dare"))
+            await send(factory.callback(chat_id, cur, f"choose|{kind}|{cur}", g.get("last_group_msg_id") or 0))
+            await pause()
+            await send(factory.callback(chat_id, cur, f"set|{kind}_{rng.choice(('boy', 'girl'))}|{cur}"))
+            continue
+        r = rng.random()
+        if r < p_change:
+            await send(factory.callback(chat_id, cur, f"resp|change|{cur}"))
+            continue
+        metrics.turn_pressed[chat_id] = time.perf_counter()
+        action = "no" if r < p_change + p_refuse else "done"
+        await send(factory.callback(chat_id, cur, f"resp|{action}|{cur}"))
+
+
+def summarize(values, scale=1000.0):
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "p50": round(percentile(values, 50) * scale, 3),
+        "p90": round(percentile(values, 90) * scale, 3),
+        "p99": round(percentile(values, 99) * scale, 3),
+        "max": round(max(values) * scale, 3),
+    }
+
+
+async def run(args, api_url):
+    metrics = Metrics()
+    instrument(metrics)
+    main.TURN_TIMEOUT = args.turn_timeout
+
+    builder = ApplicationBuilder().token(FAKE_TOKEN).base_url(f"{api_url}/bot").updater(None)
+    if args.concurrent_updates:
+        builder = builder.concurrent_updates(True)
+    app = builder.build()
+    main.register_handlers(app)
+
+    async def done(update, context):
+        entry = metrics.pending.pop(update.update_id, None)
+        if entry:
+            metrics.update_latency.append(time.perf_counter() - entry[0])
+            if not entry[1].done():
+                entry[1].set_result(None)
+        metrics.processed += 1
+
+    # گروه 99 بعد از هندلر اصلی اجرا می‌شود => زمان پایان پردازش آپدیت
+    app.add_handler(TypeHandler(Update, done), group=99)
+
+    await app.initialize()
+    await app.start()
+    monitors = [asyncio.create_task(lag_monitor(metrics)), asyncio.create_task(memory_monitor(metrics))]
+    factory = UpdateFactory(app.bot)
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    deadline = started + args.duration
+    groups = [
+        asyncio.create_task(play_group(
+            app, factory, metrics, gi, args.players, deadline,
+            (args.think_min, args.think_max), args.p_change, args.p_refuse, args.p_afk,
+            random.Random(rng.random()),
+        ))
+        for gi in range(args.groups)
+    ]
+    try:
+        await asyncio.wait(groups, timeout=args.duration + args.turn_timeout + 30)
+    finally:
+        elapsed = time.perf_counter() - started
+        for t in groups + monitors + list(main.current_tasks.values()):
+            t.cancel()
+        await app.stop()
+        await app.shutdown()
+        # منتظر نوشتن‌های باقی‌مانده (state و امتیازات) روی ترد I/O
+        await main.run_io(lambda: None)
+
+    try:
+        api_calls = httpx.get(f"{api_url}/stats", timeout=5).json()
+    except Exception:
+        api_calls = {}
+    rss = metrics.rss or [rss_bytes()]
+    writes = bot_metrics.save_state_seconds.values.get((), [0.0, 0])
+    written = bot_metrics.save_state_bytes.values.get((), [0.0, 0])
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("json_out", "baseline")},
+        "elapsed_seconds": round(elapsed, 3),
+        "updates_processed": metrics.processed,
+        "updates_per_second": round(metrics.processed / elapsed, 2) if elapsed else 0,
+        "update_latency_ms": summarize(metrics.update_latency),
+        "turns": metrics.turns,
+        "turns_per_second": round(metrics.turns / elapsed, 2) if elapsed else 0,
+        "turn_transition_ms": summarize(metrics.turn_latency),
+        "turn_transition_timeout_ms": summarize(metrics.timeout_turn_latency),
+        "event_loop_lag_ms": summarize(metrics.loop_lag),
+        "memory": {
+            "rss_start_mb": round(rss[0] / 2**20, 2),
+            "rss_end_mb": round(rss[-1] / 2**20, 2),
+            "rss_peak_mb": round(max(rss) / 2**20, 2),
+            "rss_growth_mb": round((rss[-1] - rss[0]) / 2**20, 2),
+        },
+        "save_state": {
+            "writes": writes[-1],
+            "bytes_written": int(written[-2]),
+            "seconds": round(writes[-2], 3),
+        },
+        "api_calls": api_calls,
+    }
+
+
+def _flatten(d, prefix=""):
+    out = {}
+    for k, v in d.items():
+        if isinstance(v, dict):
+            out.update(_flatten(v, f"{prefix}{k}."))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            out[f"{prefix}{k}"] = v
+    return out
+
+
+def compare(report: dict, baseline: dict):
+    cur, base = _flatten(report), _flatten(baseline)
+    print(f"{'metric':<40}{'baseline':>14}{'current':>14}{'change':>10}")
+    for key in sorted(cur):
+        if key.startswith("config.") or key not in base:
+            continue
+        b, c = base[key], cur[key]
+        change = f"{(c - b) / b * 100:+.1f}%" if b else "-"
+        print(f"{key:<40}{b:>14}{c:>14}{change:>10}")
+
+
+def cli():
+    parser = argparse.ArgumentParser(description="synthetic load test for the truth-or-dare bot")
+    parser.add_argument("--groups", type=int, default=50)
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=30.0, help="ثانیه")
+    # باید از سه مکث think-max (انتخاب، نوع سوال، پاسخ) بیشتر باشد تا پاسخ‌ها قبل از مهلت برسند
+    parser.add_argument("--turn-timeout", type=float, default=15.0, help="جایگزین TURN_TIMEOUT در طول تست")
+    parser.add_argument("--think-min", type=float, default=0.2)
+    parser.add_argument("--think-max", type=float, default=2.0)
+    parser.add_argument("--p-change", type=float, default=0.1)
+    parser.add_argument("--p-refuse", type=float, default=0.1)
+    parser.add_argument("--p-afk", type=float, default=0.05)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="تاخیر Bot API جعلی (ثانیه)")
+    parser.add_argument("--concurrent-updates", action="store_true")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", dest="json_out", help="ذخیره‌ی نتیجه به صورت JSON")
+    parser.add_argument("--baseline", help="JSON نتیجه‌ی قبلی برای مقایسه")
+    args = parser.parse_args()
+    json_out = os.path.abspath(args.json_out) if args.json_out else None
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve_fake_api, args=(port_queue, args.api_latency), daemon=True)
+    server.start()
+    api_url = f"http://127.0.0.1:{port_queue.get(timeout=10)}"
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            main.state = {"games": {}, "scores": {}}
+            main.ensure_data_folder()
+            main.ensure_question_files()
+            main.questions.compile_stale(main.FILES)
+            main.open_score_store()
+            report = asyncio.run(run(args, api_url))
+    finally:
+        server.terminate()
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if json_out:
+        with open(json_out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+    if baseline:
+        compare(report, baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
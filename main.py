@@ -1,29 +1,80 @@
 # main.py
 import asyncio
+import hashlib
+import io
 import json
 import os
 import random
-from typing import Optional
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.constants import ParseMode
 from telegram.ext import (
     ApplicationBuilder,
     CallbackQueryHandler,
+    ChatMemberHandler,
     CommandHandler,
     ContextTypes,
+    MessageHandler,
+    TypeHandler,
+    filters,
 )
 
 # ---------- تنظیمات (از config.py) ----------
 from config import BOT_TOKEN, ADMIN_ID, DATA_FOLDER, SCORE_FILE
+import broadcast
+import export
+import metrics
+import profiling
+import questions
+import seen
+from store import ScoreStore, SeenStore, StatsStore, WeightStore
+from weights import QuestionWeights
 
 # پارامترها (قابل تغییر)
-TURN_TIMEOUT = 100           # ثانیه زمان پاسخ
+TURN_TIMEOUT = 100           # ثانیه زمان پاسخ (پیش‌فرض و سقف مهلت تطبیقی)
+TURN_TIMEOUT_MIN = 20        # کف مهلت تطبیقی
+TURN_TIMEOUT_PERCENTILE = 90  # مهلت = این صدک زمان پاسخ‌های اخیر × TURN_TIMEOUT_MARGIN
+TURN_TIMEOUT_MARGIN = 1.5
+ADAPTIVE_MIN_SAMPLES = 5     # کمتر از این تعداد پاسخ: آمار گروه، و بعد TURN_TIMEOUT
+RESPONSE_HISTORY = 50        # تعداد زمان پاسخ‌های نگه‌داشته برای هر گروه
+PLAYER_RESPONSE_HISTORY = 20  # ... برای هر بازیکن
+AUTO_SKIP_AFTER = 2          # بعد از این تعداد تایم‌اوت پشت سر هم مهلت کوتاه می‌شود (0 = غیرفعال)
+AUTO_SKIP_SECONDS = 15
 SCORE_DARE = 2
 SCORE_TRUTH = 1
 PENALTY_NO_ANSWER = -1
 MAX_CHANGES_PER_TURN = 2
 AUTO_DELETE_SECONDS = 15    # حذف خودکار پیام‌های اطلاع‌رسانی join/leave
+RECORD_UPDATES = False       # ضبط آپدیت‌ها (ناشناس) برای replay.py
+RECORD_FILE = "requests.jsonl"
+METRICS_HOST = "127.0.0.1"   # endpoint متریک‌ها (Prometheus) روی /metrics
+METRICS_PORT = 9108          # 0 = غیرفعال
+PROFILE_DEFAULT_SECONDS = 30  # مدت پیش‌فرض /profile
+PROFILE_MAX_SECONDS = 600
+LOOP_LAG_WARN_SECONDS = 0.5  # اگر event loop بیشتر از این بلاک شد، استک چاپ می‌شود
+SHARD_WORKERS = 1            # >1: چند پروسه (shard.py) با امتیازات مشترک در SCORE_DB
+SCORE_DB = "scores.sqlite3"  # امتیازات، سوال‌های دیده‌شده، وزن‌ها و آمار
+PACK_MAX_BYTES = 20 * 1024 * 1024            # حداکثر حجم فایل پک (محدودیت دانلود Bot API)
+PACK_CACHE_MAX_BYTES = 64 * 1024 * 1024      # حجم کل پک‌های باز در حافظه (LRU)
+PACK_CACHE_MAX_ENTRIES = 512
+SEEN_CACHE_MAX_BYTES = 32 * 1024 * 1024      # حجم کل bitsetهای سوال‌های دیده‌شده در حافظه (LRU)
+WEIGHTS_CACHE_ENTRIES = 512                  # تعداد بانک‌هایی که وزن‌هایشان در حافظه است
+ALIAS_REBUILD_SECONDS = 30                   # فاصله‌ی ساخت دوباره‌ی جدول‌های alias
+FEEDBACK_CHANGE = 0.85                       # ضریب وزن سوال وقتی عوض می‌شود
+FEEDBACK_REFUSE = 0.75                       # ... وقتی بازیکن پاسخ نمی‌دهد
+FEEDBACK_TIMEOUT = 0.9                       # ... وقتی وقت تمام می‌شود
+FEEDBACK_DONE = 1.05                         # ... وقتی پاسخ داده می‌شود (بازیابی تدریجی)
+BROADCAST_RATE = 20                          # پیام در ثانیه (سقف Bot API حدود 30؛ بقیه برای خود بازی)
+BROADCAST_CONCURRENCY = 8
+BROADCAST_PROGRESS_SECONDS = 10              # فاصله‌ی به‌روزرسانی پیام پیشرفت
+CHAT_ADMINS_TTL = 600                        # اعتبار لیست ادمین‌های هر گروه (ثانیه)
+CHAT_ADMINS_CACHE_ENTRIES = 10000
+EXPORT_SEND_MAX_BYTES = 8 * 1024 * 1024      # بزرگ‌تر از این با تلگرام فرستاده نمی‌شود (export.py CLI)
+EVENTS_KEEP_DAYS = 90                        # رویدادهای قدیمی‌تر (export events) حذف می‌شوند؛ 0 = نگه‌داشتن همیشگی
 
 # فایل state (از کانفیگ استفاده می‌کنیم)
 STATE_FILE = SCORE_FILE
@@ -31,14 +82,63 @@ STATE_FILE = SCORE_FILE
 # ---------- وضعیت کلی در حافظه ----------
 state = {"games": {}, "scores": {}}
 current_tasks: dict = {}  # chat_id -> asyncio.Task (واچرها)
+score_store = None        # store.ScoreStore روی SCORE_DB (open_score_store یا shard.worker_main)
+
+metrics.Gauge("bot_active_games", "Games currently started.",
+              lambda: sum(1 for g in state.get("games", {}).values() if g.get("started")))
+metrics.Gauge("bot_pending_timers", "Turn watchers still waiting.",
+              lambda: sum(1 for t in list(current_tasks.values()) if not t.done()))
 
 # ---------- کمک‌کننده‌ها ----------
-def save_state():
+# همه‌ی کارهای دیسک روی یک ترد جدا (ترتیب نوشتن‌ها حفظ می‌شود)
+IO_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="io")
+_save_pending = False
+
+
+async def run_io(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(IO_EXECUTOR, fn, *args)
+
+
+def run_bg(fn, *args) -> asyncio.Future:
+    # کارهای طولانی (alias، export، snapshot حافظه) روی thread pool پیش‌فرض تا نوشتن‌های IO_EXECUTOR عقب نیفتند
+    return asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+def _write_state(data: str):
+    t0 = time.perf_counter()
     try:
-        with open(STATE_FILE, "w", encoding="utf-8") as f:
-            json.dump(state, f, ensure_ascii=False, indent=2)
+        tmp = STATE_FILE + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, STATE_FILE)
+        metrics.save_state_bytes.observe(len(data.encode("utf-8")))
     except Exception:
-        pass
+        metrics.swallowed()
+    metrics.save_state_seconds.observe(time.perf_counter() - t0)
+
+
+def _flush_state():
+    global _save_pending
+    _save_pending = False
+    try:
+        data = json.dumps(state, ensure_ascii=False, indent=2)
+    except Exception:
+        metrics.swallowed()
+        return
+    IO_EXECUTOR.submit(_write_state, data)
+
+
+def save_state():
+    # داخل event loop: چند save پشت‌سرهم در یک نوشتن (روی ترد I/O) ادغام می‌شوند
+    global _save_pending
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _write_state(json.dumps(state, ensure_ascii=False, indent=2))
+        return
+    if not _save_pending:
+        _save_pending = True
+        loop.call_soon(_flush_state)
 
 
 def load_state():
@@ -54,12 +154,80 @@ def load_state():
 
 
 def is_admin(user_id) -> bool:
+    # ادمین کل ربات (ADMIN_ID در config.py)
     try:
         return int(user_id) == int(ADMIN_ID)
     except Exception:
         return False
 
 
+# ---------- ادمین‌های هر گروه ----------
+# chat_id -> (frozenset آیدی ادمین‌ها, زمان گرفتن)؛ بررسی‌ها تا TTL فقط از حافظه است
+chat_admins: "OrderedDict" = OrderedDict()
+_admin_fetches: dict = {}  # chat_id -> Task؛ درخواست‌های هم‌زمان یک getChatAdministrators می‌شوند
+ADMIN_STATUSES = ("administrator", "creator")
+
+
+async def _fetch_chat_admins(bot, chat_id: int) -> frozenset:
+    members = await bot.get_chat_administrators(chat_id)
+    return frozenset(m.user.id for m in members)
+
+
+async def chat_admin_ids(bot, chat_id: int) -> frozenset:
+    entry = chat_admins.get(chat_id)
+    if entry is not None:
+        chat_admins.move_to_end(chat_id)
+        if time.monotonic() - entry[1] < CHAT_ADMINS_TTL:
+            return entry[0]
+    task = _admin_fetches.get(chat_id)
+    if task is None:
+        task = asyncio.create_task(_fetch_chat_admins(bot, chat_id))
+        _admin_fetches[chat_id] = task
+        task.add_done_callback(lambda _t: _admin_fetches.pop(chat_id, None))
+    try:
+        ids = await asyncio.shield(task)
+    except Exception:
+        metrics.swallowed()
+        # API در دسترس نیست: لیست قدیمی بهتر از هیچ است
+        return entry[0] if entry is not None else frozenset()
+    chat_admins[chat_id] = (ids, time.monotonic())
+    while len(chat_admins) > CHAT_ADMINS_CACHE_ENTRIES:
+        chat_admins.popitem(last=False)
+    return ids
+
+
+async def is_chat_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    """ادمین کل ربات، یا ادمین/سازنده‌ی همین گروه."""
+    user = update.effective_user
+    chat = update.effective_chat
+    if user and is_admin(user.id):
+        return True
+    if chat is None or chat.type == "private":
+        return False
+    msg = update.effective_message
+    if msg and msg.sender_chat and msg.sender_chat.id == chat.id:
+        return True  # ادمین ناشناس (پیام از طرف خود گروه)
+    if user is None:
+        return False
+    return user.id in await chat_admin_ids(context.bot, chat.id)
+
+
+async def chat_member_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # ارتقا/عزل ادمین؛ فقط اگر لیست این گروه در کش است به‌روز می‌شود
+    cm = update.chat_member
+    if not cm:
+        return
+    entry = chat_admins.get(cm.chat.id)
+    if entry is None:
+        return
+    ids = set(entry[0])
+    if cm.new_chat_member.status in ADMIN_STATUSES:
+        ids.add(cm.new_chat_member.user.id)
+    else:
+        ids.discard(cm.new_chat_member.user.id)
+    chat_admins[cm.chat.id] = (frozenset(ids), entry[1])
+
+
 def mention_html(uid: int, fallback: str = "کاربر") -> str:
     return f"<a href='tg://user?id={uid}'>{fallback}</a>"
 
@@ -85,11 +253,133 @@ def delete_later(bot, chat_id: int, message_id: int, delay: int = AUTO_DELETE_SE
             await asyncio.sleep(delay)
             await bot.delete_message(chat_id=chat_id, message_id=message_id)
         except Exception:
-            pass
+            metrics.swallowed()
     try:
         asyncio.create_task(_del())
     except Exception:
-        pass
+        metrics.swallowed()
+
+# ---------- ضبط آپدیت‌ها برای بنچمارک (replay.py) ----------
+def _anon_id(value: int) -> int:
+    h = int(hashlib.sha256(f"{BOT_TOKEN}:{abs(value)}".encode()).hexdigest()[:12], 16)
+    return -h if value < 0 else h
+
+
+# کلمه‌هایی از آرگومان دستورها که در رکورد می‌مانند (بقیه ممکن است نام یا متن شخصی باشند)
+_RECORD_ARGS = {"stop", "clear", "all", "group", "raw", "csv", "jsonl", "scores", "leaderboards", "events"}
+
+
+def _anon_text(text: str) -> str:
+    # فقط دستور و آرگومان‌های شناخته‌شده (مثل /pack truth_boy) می‌مانند؛ عددها مثل آیدی‌ها هش می‌شوند
+    if not text.startswith("/"):
+        return ""
+    words = text.split()
+    out = [words[0]]
+    for w in words[1:]:
+        if w.lstrip("-").isdigit():
+            out.append(str(_anon_id(int(w))))
+        elif w in _RECORD_ARGS or w in FILES:
+            out.append(w)
+    return " ".join(out)
+
+
+def _anon_data(data: str) -> str:
+    # callback_data مثل choose|truth|<pid>
+    return "|".join(str(_anon_id(int(p))) if p.lstrip("-").isdigit() else p for p in data.split("|"))
+
+
+def _anon_user(u) -> Optional[dict]:
+    if not isinstance(u, dict) or not isinstance(u.get("id"), int):
+        return None
+    return {"id": _anon_id(u["id"]), "is_bot": bool(u.get("is_bot")), "first_name": "anon"}
+
+
+def _anon_chat(c) -> Optional[dict]:
+    if not isinstance(c, dict) or not isinstance(c.get("id"), int):
+        return None
+    return {"id": _anon_id(c["id"]), "type": c.get("type", "group")}
+
+
+def _anon_message(m, reply: bool = True) -> Optional[dict]:
+    if not isinstance(m, dict) or _anon_chat(m.get("chat")) is None:
+        return None
+    out = {"message_id": m.get("message_id", 0), "date": m.get("date", 0), "chat": _anon_chat(m["chat"])}
+    if _anon_user(m.get("from")):
+        out["from"] = _anon_user(m["from"])
+    if _anon_chat(m.get("sender_chat")):
+        out["sender_chat"] = _anon_chat(m["sender_chat"])
+    text = _anon_text(m["text"]) if isinstance(m.get("text"), str) else ""
+    if text:
+        out["text"] = text
+        out["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split(" ")[0])}]
+    if reply and m.get("reply_to_message"):
+        r = _anon_message(m["reply_to_message"], reply=False)
+        if r:
+            out["reply_to_message"] = r
+    return out
+
+
+def _anon_member(cm) -> Optional[dict]:
+    # وضعیت و مجوزها (can_*) لازم‌اند تا ChatMember.de_json کلاس درست را بسازد؛ custom_title و بقیه نه
+    if not isinstance(cm, dict) or _anon_user(cm.get("user")) is None:
+        return None
+    out = {"status": cm.get("status"), "user": _anon_user(cm["user"])}
+    for k, v in cm.items():
+        if k.startswith("can_") or k in ("is_anonymous", "is_member", "until_date"):
+            out[k] = v
+    return out
+
+
+def anonymize_update(data: dict) -> Optional[dict]:
+    """رکورد replay از روی whitelist: فقط دستورها، دکمه‌ها و chat_member (همان‌هایی که replay.route
+    اجرا می‌کند)، با آیدی‌های هش‌شده (پایدار). بقیه‌ی آپدیت‌ها None (ذخیره نمی‌شوند)."""
+    out = {"update_id": data.get("update_id", 0)}
+    msg = data.get("message")
+    cq = data.get("callback_query")
+    cm = data.get("chat_member")
+    if isinstance(msg, dict) and isinstance(msg.get("text"), str) and msg["text"].startswith("/"):
+        m = _anon_message(msg)
+        if m is None:
+            return None
+        out["message"] = m
+    elif isinstance(cq, dict) and _anon_user(cq.get("from")):
+        q = {"id": str(cq.get("id", "")), "from": _anon_user(cq["from"]), "chat_instance": "anon"}
+        if isinstance(cq.get("data"), str):
+            q["data"] = _anon_data(cq["data"])
+        m = _anon_message(cq.get("message"), reply=False)
+        if m:
+            q["message"] = m
+        out["callback_query"] = q
+    elif isinstance(cm, dict):
+        chat, old, new = _anon_chat(cm.get("chat")), _anon_member(cm.get("old_chat_member")), _anon_member(cm.get("new_chat_member"))
+        if not (chat and old and new and _anon_user(cm.get("from"))):
+            return None
+        out["chat_member"] = {"chat": chat, "from": _anon_user(cm["from"]), "date": cm.get("date", 0),
+                              "old_chat_member": old, "new_chat_member": new}
+    else:
+        return None
+    return out
+
+
+def _append_line(path: str, line: str):
+    try:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except Exception:
+        metrics.swallowed()
+
+
+async def record_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not RECORD_UPDATES:
+        return
+    try:
+        rec = anonymize_update(update.to_dict())
+        if rec is None:
+            return
+        line = json.dumps({"ts": time.time(), "update": rec}, ensure_ascii=False)
+        IO_EXECUTOR.submit(_append_line, RECORD_FILE, line)
+    except Exception:
+        metrics.swallowed()
 
 # ---------- سوال‌ها (اگر فایل غایب بود، همین‌ها را بنویس) ----------
 FILES = {
@@ -203,7 +493,6 @@ def ensure_question_files():
             "وویس بگیر و صدای خر دربیار",
             "8 ثانیه از محیطی که الان هستی فیلم بگیر و بفرست گروه",
             "به یکی از اعضای گپ بگو روشون کراش داری",
-            "یک جوک خنده دار برای گروه تعریف کن.",
             "عکس سعید طوسی رو دانلود کن و برای دو ساعت بزاز پروفایلت",
             "دو عکس اخر گالریت رو به اشتراک بزار",
             "از صفحه گوشیت اسکرین بفرست",
@@ -223,7 +512,6 @@ def ensure_question_files():
             "وویس بگیر و صدای خر دربیار",
             "8 ثانیه از محیطی که الان هستی فیلم بگیر و بفرست گروه",
             "به یکی از اعضای گپ بگو روشون کراش داری",
-            "یک جوک خنده دار برای گروه تعریف کن.",
             "عکس آنا در آرماس  رو دانلود کن و برای دو ساعت بزاز پروفایلت",
             "دو عکس اخر گالریت را به اشتراک بزار",
             "از صفحه گوشیت اسکرین بفرست",
@@ -252,7 +540,232 @@ def load_questions(fn: str):
         return [l.strip() for l in f if l.strip()]
 
 
-def get_random_question(qtype: str, avoid: Optional[str] = None) -> Optional[str]:
+question_banks = questions.BankCache()  # فایل‌های .bank (mmap) ساخته‌شده توسط questions.py
+chat_packs = questions.PackCache(PACK_CACHE_MAX_BYTES, PACK_CACHE_MAX_ENTRIES)  # (chat_id, qtype) -> پک اختصاصی
+
+
+def pack_path(chat_id: int, qtype: str) -> str:
+    return os.path.join(DATA_FOLDER or ".", "packs", str(chat_id), f"{qtype}.bank")
+
+
+async def chat_pack(chat_id: int, qtype: str):
+    """پک اختصاصی چت؛ اولین بار (lazy) از دیسک باز و در LRU نگه داشته می‌شود."""
+    key = (chat_id, qtype)
+    hit, bank = chat_packs.lookup(key)
+    if hit:
+        return bank
+    bank = await run_io(questions.open_bank, pack_path(chat_id, qtype))
+    chat_packs.put(key, bank)
+    return bank
+
+
+# ---------- سوال‌های دیده‌شده‌ی هر کاربر (bitset در SCORE_DB) ----------
+seen_cache: "OrderedDict" = OrderedDict()  # (uid, bank_key) -> (SeenSet, signature, size)
+seen_cache_bytes = 0
+_seen_store = None
+
+
+def _seen_db() -> SeenStore:
+    # فقط روی IO_EXECUTOR صدا زده می‌شود
+    global _seen_store
+    if _seen_store is None:
+        _seen_store = SeenStore(SCORE_DB)
+    return _seen_store
+
+
+def _load_seen(uid, key: str):
+    try:
+        return _seen_db().get(uid, key)
+    except Exception:
+        metrics.swallowed()
+        return None
+
+
+def _save_seen(uid, key: str, n: int, sig: bytes, bits: bytes):
+    try:
+        _seen_db().put(uid, key, n, sig, bits)
+    except Exception:
+        metrics.swallowed()
+
+
+async def seen_set(uid, key: str, bank) -> seen.SeenSet:
+    global seen_cache_bytes
+    ck = (uid, key)
+    entry = seen_cache.get(ck)
+    s = None
+    if entry is not None:
+        seen_cache.move_to_end(ck)
+        if entry[0].n <= len(bank) and entry[1] == seen.signature(bank, entry[0].n):
+            s = entry[0]
+    else:
+        row = await run_io(_load_seen, uid, key)
+        if row:
+            n, sig, bits = row
+            if n <= len(bank) and bytes(sig) == seen.signature(bank, n):
+                s = seen.SeenSet(n, bits)
+    if s is None:
+        # اولین بار، یا بانک جایگزین شده (شماره‌ی سوال‌ها دیگر معتبر نیست)
+        s = seen.SeenSet(len(bank))
+    s.resize(len(bank))
+    # با 100k سوال هر bitset حدود 12.5KB است؛ سقف بر اساس حجم، نه تعداد
+    old = seen_cache.get(ck)  # دوباره، چون ممکن است در حین await پر شده باشد
+    if old is not None:
+        seen_cache_bytes -= old[2]
+    seen_cache[ck] = (s, seen.signature(bank, s.n), len(s.bits))
+    seen_cache_bytes += len(s.bits)
+    while len(seen_cache) > 1 and seen_cache_bytes > SEEN_CACHE_MAX_BYTES:
+        seen_cache_bytes -= seen_cache.popitem(last=False)[1][2]
+    return s
+
+
+# ---------- وزن سوال‌ها از بازخورد (weights.py) ----------
+weights_cache: "OrderedDict" = OrderedDict()  # bank_key -> QuestionWeights
+_weight_store = None
+
+
+def _weights_db() -> WeightStore:
+    # روی IO_EXECUTOR صدا زده می‌شود (و در flush_state بعد از بسته شدن آن)
+    global _weight_store
+    if _weight_store is None:
+        _weight_store = WeightStore(SCORE_DB)
+    return _weight_store
+
+
+def _load_weights(key: str):
+    try:
+        return _weights_db().get(key)
+    except Exception:
+        metrics.swallowed()
+        return None
+
+
+def _save_weights(key: str, n: int, sig: bytes, data: bytes):
+    try:
+        _weights_db().put(key, n, sig, data)
+    except Exception:
+        metrics.swallowed()
+
+
+def _flush_weights(key: str, qw):
+    IO_EXECUTOR.submit(_save_weights, key, qw.n, qw.sig, qw.weights.tobytes())
+
+
+def _build_weights(qw: QuestionWeights):
+    fut = run_bg(qw.rebuild)
+    fut.add_done_callback(lambda f: not f.cancelled() and f.exception() and metrics.swallowed())
+
+
+async def question_weights(key: str, bank) -> QuestionWeights:
+    qw = weights_cache.get(key)
+    if qw is not None and qw.n <= len(bank) and qw.sig == seen.signature(bank, qw.n):
+        weights_cache.move_to_end(key)
+    else:
+        qw = None
+        row = await run_io(_load_weights, key)
+        if row:
+            n, sig, data = row
+            if n <= len(bank) and bytes(sig) == seen.signature(bank, n):
+                qw = QuestionWeights(n, bytes(data), build=False)
+        if qw is None:
+            # اولین بار، یا بانک جایگزین شده: همه‌ی وزن‌ها برابر
+            qw = QuestionWeights(len(bank), build=False)
+        qw.resize(len(bank))
+        # ساختن جدول alias برای بانک بزرگ ده‌ها میلی‌ثانیه است؛ تا آماده شود sample یکنواخت است
+        _build_weights(qw)
+        weights_cache[key] = qw
+        while len(weights_cache) > WEIGHTS_CACHE_ENTRIES:
+            old_key, old = weights_cache.popitem(last=False)
+            if old.dirty:
+                _flush_weights(old_key, old)
+    qw.resize(len(bank))
+    qw.sig = seen.signature(bank, qw.n)
+    return qw
+
+
+def question_feedback(g: dict, factor: float):
+    """بازخورد روی سوال فعلی بازی (change/no/timeout/done)."""
+    ref = g.get("current_qref")
+    if not ref:
+        return
+    key, _, idx = ref.rpartition("#")
+    qw = weights_cache.get(key)
+    if qw is not None and idx.isdigit():
+        qw.feedback(int(idx), factor)
+
+
+async def rebuild_weights_loop():
+    # جدول‌های alias بانک‌هایی که بازخورد گرفته‌اند در پس‌زمینه دوباره ساخته و ذخیره می‌شوند
+    while True:
+        await asyncio.sleep(ALIAS_REBUILD_SECONDS)
+        for key, qw in list(weights_cache.items()):
+            if not qw.dirty:
+                continue
+            qw.dirty = False
+            try:
+                await run_bg(qw.rebuild)
+            except Exception:
+                metrics.swallowed()
+                continue
+            _flush_weights(key, qw)
+
+
+async def _draw_unseen(uid, key: str, bank, qw: QuestionWeights, avoid: Optional[str]) -> int:
+    s = await seen_set(uid, key, bank)
+    # نمونه‌ی وزن‌دار؛ اگر چند بار پشت سر هم دیده‌شده بود، یک سوال دیده‌نشده‌ی دلخواه
+    for _ in range(8):
+        i = qw.sample()
+        if i not in s and not (avoid and len(bank) > 1 and bank[i] == avoid):
+            break
+    else:
+        i = s.pick_unseen()
+        if i is None:
+            # همه‌ی سوال‌های این دسته دیده شده‌اند؛ از اول
+            s.reset()
+            i = s.pick_unseen()
+    s.add(i)
+    IO_EXECUTOR.submit(_save_seen, uid, key, s.n, seen_cache[(uid, key)][1], bytes(s.bits))
+    return i
+
+
+def _draw(bank, qw: QuestionWeights, avoid: Optional[str]) -> int:
+    # انتخاب O(1) از بانک mmap شده، بدون خواندن کل فایل
+    i = qw.sample()
+    a = 0
+    while avoid and len(bank) > 1 and bank[i] == avoid and a < 6:
+        i = qw.sample()
+        a += 1
+    return i
+
+
+async def draw_question(qtype: str, avoid: Optional[str] = None, chat_id: Optional[int] = None,
+                        uid: Optional[int] = None) -> Optional[Tuple[str, Optional[str]]]:
+    """(متن سوال, ref) که ref برای بازخورد وزن‌ها به شکل "<bank_key>#<index>" است."""
+    filename = FILES.get(qtype)
+    if not filename:
+        return None
+    bank = None
+    if chat_id is not None:
+        bank = await chat_pack(chat_id, qtype)
+        key = f"pack:{chat_id}:{qtype}"
+    if bank is None or not len(bank):
+        path = questions.bank_path(filename)
+        hit, bank = question_banks.cached(path)
+        if not hit:
+            bank = await run_io(question_banks.get, path)
+        key = f"global:{qtype}"
+    if bank is not None and len(bank):
+        qw = await question_weights(key, bank)
+        if uid is not None:
+            i = await _draw_unseen(uid, key, bank, qw, avoid)
+        else:
+            i = _draw(bank, qw, avoid)
+        return bank[i], f"{key}#{i}"
+    q = await get_random_question(qtype, avoid)
+    return (q, None) if q else None
+
+
+async def get_random_question(qtype: str, avoid: Optional[str] = None) -> Optional[str]:
+    # وقتی بانک .bank ساخته نشده: انتخاب یکنواخت از فایل txt
     filename = {
         "truth_boy": FILES["truth_boy"],
         "truth_girl": FILES["truth_girl"],
@@ -261,7 +774,7 @@ def get_random_question(qtype: str, avoid: Optional[str] = None) -> Optional[str
     }.get(qtype)
     if not filename:
         return None
-    qs = load_questions(filename)
+    qs = await run_io(load_questions, filename)
     if not qs:
         return None
     if avoid and len(qs) > 1:
@@ -282,7 +795,9 @@ def init_game(chat_id: int):
             "idx": -1,
             "awaiting": False,
             "current_question": "",
+            "current_qref": None,
             "current_type": "",
+            "asked_at": None,
             "change_count": {},
             "started": False,
             "last_group_msg_id": None,
@@ -291,21 +806,131 @@ def init_game(chat_id: int):
         save_state()
 
 
+def _add_score(uid, amount: int):
+    try:
+        score_store.add(uid, amount)
+    except Exception:
+        metrics.swallowed()
+
+
 def add_score(uid, amount=1):
-    s = state.setdefault("scores", {})
-    k = str(uid)
-    if k not in s:
-        s[k] = {"score": 0}
-    s[k]["score"] += amount
-    save_state()
+    IO_EXECUTOR.submit(_add_score, uid, amount)
+
+
+async def fetch_leaderboard(limit=10):
+    return await run_io(score_store.top, limit)
+
+
+def open_score_store():
+    """حالت تک-پروسه هم امتیازات را در SCORE_DB نگه می‌دارد تا leaderboard و /export از SQLite بخوانند.
+
+    امتیازات قدیمی state["scores"] (scores.json) یک بار منتقل و از state حذف می‌شوند.
+    """
+    global score_store
+    score_store = ScoreStore(SCORE_DB)
+    legacy = state.get("scores")
+    if legacy:
+        if score_store.is_empty():
+            score_store.import_scores(legacy)
+            print(f"imported {len(legacy)} scores into {SCORE_DB}")
+        state["scores"] = {}
+        save_state()
+
+
+# ---------- آمار بازیکن‌ها (/stats) ----------
+# شمارنده‌ها همان لحظه‌ی رویداد زیاد می‌شوند؛ /stats فقط یک سطر می‌خواند
+_stats_store = None
+
+
+def _stats_db() -> StatsStore:
+    # فقط روی IO_EXECUTOR صدا زده می‌شود
+    global _stats_store
+    if _stats_store is None:
+        _stats_store = StatsStore(SCORE_DB)
+    return _stats_store
+
+
+def _add_stats(chat_id, uid, deltas: dict):
+    try:
+        _stats_db().add(chat_id, uid, deltas)
+    except Exception:
+        metrics.swallowed()
+
+
+def _get_stats(scope, uid):
+    try:
+        return _stats_db().get(scope, uid)
+    except Exception:
+        metrics.swallowed()
+        return None
+
+
+def _prune_events(before: float):
+    try:
+        _stats_db().prune_events(before)
+    except Exception:
+        metrics.swallowed()
+
+
+async def prune_events_loop():
+    # جدول events فقط برای export است؛ بدون این حلقه بی‌نهایت بزرگ می‌شود
+    while EVENTS_KEEP_DAYS:
+        await run_io(_prune_events, time.time() - EVENTS_KEEP_DAYS * 86400)
+        await asyncio.sleep(3600)
+
+
+def record_stats(chat_id, uid, **deltas):
+    IO_EXECUTOR.submit(_add_stats, chat_id, uid, deltas)
+
+
+def record_response(chat_id, uid, g: dict, **deltas):
+    """پاسخ (done/no): زمان از نمایش سوال تا فشردن دکمه هم ثبت می‌شود."""
+    asked = g.get("asked_at")
+    if asked:
+        deltas["responses"] = 1
+        deltas["resp_ms"] = max(0, int((time.time() - asked) * 1000))
+        note_response(g, uid, deltas["resp_ms"])
+    g.get("missed", {}).pop(str(uid), None)
+    record_stats(chat_id, uid, **deltas)
+
+
+# ---------- مهلت نوبت تطبیقی ----------
+# زمان پاسخ‌های اخیر هر گروه و هر بازیکن (ms) در state خود بازی نگه داشته می‌شود
+def note_response(g: dict, uid, ms: int):
+    recent = g.setdefault("resp_ms", [])
+    recent.append(ms)
+    del recent[:-RESPONSE_HISTORY]
+    mine = g.setdefault("player_ms", {}).setdefault(str(uid), [])
+    mine.append(ms)
+    del mine[:-PLAYER_RESPONSE_HISTORY]
+
+
+def note_timeout(g: dict, uid) -> int:
+    missed = g.setdefault("missed", {})
+    missed[str(uid)] = missed.get(str(uid), 0) + 1
+    return missed[str(uid)]
 
 
-def get_leaderboard(limit=10):
-    items = []
-    for uid, info in state.get("scores", {}).items():
-        items.append((uid, info.get("score", 0)))
-    items.sort(key=lambda x: x[1], reverse=True)
-    return items[:limit]
+def auto_skipping(g: dict, uid) -> bool:
+    return bool(AUTO_SKIP_AFTER) and g.get("missed", {}).get(str(uid), 0) >= AUTO_SKIP_AFTER
+
+
+def turn_timeout(g: dict, uid) -> float:
+    """مهلت نوبت بازیکن (ثانیه) از صدک زمان پاسخ‌های خودش، یا اگر کم است، کل گروه."""
+    lo = min(TURN_TIMEOUT_MIN, TURN_TIMEOUT)
+    if auto_skipping(g, uid):
+        return min(AUTO_SKIP_SECONDS, TURN_TIMEOUT)
+    samples = g.get("player_ms", {}).get(str(uid)) or []
+    if len(samples) < ADAPTIVE_MIN_SAMPLES:
+        samples = g.get("resp_ms") or []
+    if len(samples) < ADAPTIVE_MIN_SAMPLES:
+        return TURN_TIMEOUT
+    t = metrics.percentile(samples, TURN_TIMEOUT_PERCENTILE) / 1000.0 * TURN_TIMEOUT_MARGIN
+    return min(TURN_TIMEOUT, max(lo, round(t)))
+
+
+async def fetch_stats(scope, uid) -> Optional[dict]:
+    return await run_io(_get_stats, scope, uid)
 
 
 def next_player_index(chat_id: int) -> Optional[int]:
@@ -384,9 +1009,8 @@ async def leave_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def startgame_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user = update.effective_user
     chat_id = update.effective_chat.id
-    if not is_admin(user.id):
+    if not await is_chat_admin(update, context):
         await context.bot.send_message(chat_id=chat_id, text="فقط ادمین می‌تواند بازی را شروع کند.")
         return
     init_game(chat_id)
@@ -406,9 +1030,8 @@ async def startgame_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def stopgame_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user = update.effective_user
     chat_id = update.effective_chat.id
-    if not is_admin(user.id):
+    if not await is_chat_admin(update, context):
         await context.bot.send_message(chat_id=chat_id, text="فقط ادمین می‌تواند بازی را متوقف کند.")
         return
     init_game(chat_id)
@@ -422,7 +1045,7 @@ async def stopgame_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         try:
             t.cancel()
         except Exception:
-            pass
+            metrics.swallowed()
         current_tasks.pop(chat_id, None)
     try:
         if g.get("last_group_msg_id"):
@@ -430,15 +1053,14 @@ async def stopgame_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
             g["last_group_msg_id"] = None
             save_state()
     except Exception:
-        pass
+        metrics.swallowed()
     await context.bot.send_message(chat_id=chat_id, text="⏹ بازی متوقف شد.")
 
 
 # ---------- حذف بازیکن (ادمین) ----------
 async def remove_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user = update.effective_user
     chat_id = update.effective_chat.id
-    if not is_admin(user.id):
+    if not await is_chat_admin(update, context):
         await context.bot.send_message(chat_id=chat_id, text="❌ فقط ادمین می‌تواند کسی را حذف کند.")
         return
 
@@ -468,7 +1090,7 @@ async def remove_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def leaderboard_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
-    items = get_leaderboard(10)
+    items = await fetch_leaderboard(10)
     if not items:
         await context.bot.send_message(chat_id=chat_id, text="هیچ امتیازی ثبت نشده.")
         return
@@ -486,11 +1108,45 @@ async def leaderboard_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await context.bot.send_message(chat_id=chat_id, text="\n".join(lines))
 
 
+def format_stats(title: str, st: Optional[dict]) -> str:
+    if not st:
+        return f"{title}\nهنوز آماری ثبت نشده."
+    avg = f"{st['resp_ms'] / st['responses'] / 1000:.1f} ثانیه" if st["responses"] else "—"
+    return (
+        f"{title}\n"
+        f"حقیقت: {st['truths']} | جرأت: {st['dares']}\n"
+        f"پاسخ نداد: {st['refusals']} | وقت تمام شد: {st['timeouts']} | تغییر سوال: {st['changes']}\n"
+        f"میانگین زمان پاسخ: {avg}"
+    )
+
+
+async def stats_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat = update.effective_chat
+    msg = update.message
+    args = context.args or []
+    if chat.type == "private":
+        st = await fetch_stats("", update.effective_user.id)
+        await context.bot.send_message(chat_id=chat.id, text=format_stats("📊 آمار شما در همه‌ی گروه‌ها:", st))
+        return
+    if args and args[0].lower() in ("group", "گروه"):
+        st = await fetch_stats(str(chat.id), "*")
+        await context.bot.send_message(chat_id=chat.id, text=format_stats("📊 آمار کل این گروه:", st))
+        return
+    # با ریپلای: آمار همان کاربر
+    user = update.effective_user
+    if msg and msg.reply_to_message and msg.reply_to_message.from_user:
+        user = msg.reply_to_message.from_user
+    here, total = await asyncio.gather(fetch_stats(str(chat.id), user.id), fetch_stats("", user.id))
+    name = mention_html(user.id, user.first_name)
+    text = format_stats(f"📊 آمار {name} در این گروه:", here) + "\n\n" + format_stats("در همه‌ی گروه‌ها:", total)
+    await context.bot.send_message(chat_id=chat.id, text=text, parse_mode=ParseMode.HTML)
+
+
 # ---------- رد کردن نوبت (ادمین) ----------
 async def skip_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     chat_id = update.effective_chat.id
-    if not is_admin(user.id):
+    if not await is_chat_admin(update, context):
         await context.bot.send_message(chat_id=chat_id, text="فقط ادمین می‌تواند نوبت را رد کند.")
         return
     init_game(chat_id)
@@ -505,7 +1161,7 @@ async def skip_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         try:
             t.cancel()
         except Exception:
-            pass
+            metrics.swallowed()
         current_tasks.pop(chat_id, None)
     g["awaiting"] = False
     save_state()
@@ -519,6 +1175,286 @@ async def skip_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await do_next_turn(chat_id, context)
 
 
+# ---------- پک سوال اختصاصی هر گروه (ادمین) ----------
+def install_pack(chat_id: int, qtype: str, data: bytes, filename: str) -> dict:
+    path = pack_path(chat_id, qtype)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    suffix = ".jsonl" if (filename or "").lower().endswith((".jsonl", ".ndjson")) else ".txt"
+    tmp = path + ".upload" + suffix
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+        return questions.import_packs(path, [tmp], replace=True)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def remove_pack(chat_id: int, qtype: str) -> bool:
+    try:
+        os.remove(pack_path(chat_id, qtype))
+        return True
+    except OSError:
+        return False
+
+
+async def pack_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    msg = update.effective_message
+    chat_id = update.effective_chat.id
+    if not await is_chat_admin(update, context):
+        await context.bot.send_message(chat_id=chat_id, text="❌ فقط ادمین می‌تواند پک سوال بگذارد.")
+        return
+    # هم "/pack <دسته>" در کپشن فایل، هم ریپلای روی فایل
+    args = (msg.caption or msg.text or "").split()[1:]
+    usage = "مثال: فایل txt/jsonl را با کپشن «/pack truth_boy» بفرستید، یا «/pack clear truth_boy»\nدسته‌ها: " + ", ".join(FILES)
+    if args and args[0] == "clear":
+        qtype = args[1] if len(args) > 1 else ""
+        if qtype not in FILES:
+            await context.bot.send_message(chat_id=chat_id, text=usage)
+            return
+        removed = await run_io(remove_pack, chat_id, qtype)
+        chat_packs.invalidate((chat_id, qtype))
+        await context.bot.send_message(chat_id=chat_id, text="✅ پک حذف شد؛ سوال‌های عمومی استفاده می‌شوند." if removed else "این گروه پکی برای این دسته ندارد.")
+        return
+    doc = msg.document or (msg.reply_to_message.document if msg.reply_to_message else None)
+    qtype = args[0] if args else ""
+    if not doc or qtype not in FILES:
+        await context.bot.send_message(chat_id=chat_id, text=usage)
+        return
+    if doc.file_size and doc.file_size > PACK_MAX_BYTES:
+        await context.bot.send_message(chat_id=chat_id, text=f"⚠️ حجم فایل بیشتر از {PACK_MAX_BYTES // (1024 * 1024)} مگابایت است.")
+        return
+    try:
+        tg_file = await context.bot.get_file(doc.file_id)
+        data = bytes(await tg_file.download_as_bytearray())
+        result = await run_io(install_pack, chat_id, qtype, data, doc.file_name)
+    except Exception:
+        metrics.swallowed()
+        await context.bot.send_message(chat_id=chat_id, text="⚠️ دریافت یا پردازش فایل ممکن نشد.")
+        return
+    chat_packs.invalidate((chat_id, qtype))
+    await context.bot.send_message(chat_id=chat_id, text=f"✅ پک {qtype} ثبت شد: {result['kept']} سوال (از {result['read']} سطر، تکراری‌ها حذف شدند).")
+
+
+# ---------- پروفایل روی پروسه‌ی اصلی (ادمین) ----------
+profile_session: dict = {"task": None, "stop": None}
+
+
+async def _send_admin_file(bot, uid: int, data: bytes, filename: str, caption: Optional[str] = None):
+    await bot.send_document(chat_id=uid, document=io.BytesIO(data), filename=filename, caption=caption)
+
+
+async def _profile_for(bot, uid: int, seconds: float, stop: asyncio.Event):
+    try:
+        await asyncio.wait_for(stop.wait(), timeout=seconds)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        result = profiling.stop_profile()
+        profile_session["task"] = None
+    if not result:
+        return
+    text, raw = result
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    try:
+        await _send_admin_file(bot, uid, text.encode("utf-8"), f"profile-{stamp}.txt", "📊 cProfile")
+        await _send_admin_file(bot, uid, raw, f"profile-{stamp}.prof")
+    except Exception:
+        metrics.swallowed()
+
+
+async def profile_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    chat_id = update.effective_chat.id
+    if not is_admin(user.id):
+        await context.bot.send_message(chat_id=chat_id, text="❌ فقط ادمین می‌تواند پروفایل بگیرد.")
+        return
+    arg = context.args[0] if context.args else ""
+    if arg == "stop":
+        if profile_session["stop"] and profile_session["task"]:
+            profile_session["stop"].set()
+            await context.bot.send_message(chat_id=chat_id, text="⏹ پروفایل متوقف شد؛ نتیجه به دایرکت ارسال می‌شود.")
+        else:
+            await context.bot.send_message(chat_id=chat_id, text="پروفایلی در حال اجرا نیست.")
+        return
+    try:
+        seconds = float(arg) if arg else PROFILE_DEFAULT_SECONDS
+    except ValueError:
+        await context.bot.send_message(chat_id=chat_id, text="مثال: /profile 60  یا  /profile stop")
+        return
+    seconds = max(1.0, min(seconds, PROFILE_MAX_SECONDS))
+    if not profiling.start_profile():
+        await context.bot.send_message(chat_id=chat_id, text="⚠️ یک پروفایل از قبل در حال اجراست.")
+        return
+    stop = asyncio.Event()
+    profile_session["stop"] = stop
+    profile_session["task"] = asyncio.create_task(_profile_for(context.bot, user.id, seconds, stop))
+    await context.bot.send_message(chat_id=chat_id, text=f"📊 پروفایل برای {int(seconds)} ثانیه شروع شد؛ نتیجه به دایرکت ارسال می‌شود.")
+
+
+async def memsnap_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    chat_id = update.effective_chat.id
+    if not is_admin(user.id):
+        await context.bot.send_message(chat_id=chat_id, text="❌ فقط ادمین می‌تواند snapshot حافظه بگیرد.")
+        return
+    if context.args and context.args[0] == "stop":
+        stopped = profiling.stop_memory()
+        await context.bot.send_message(chat_id=chat_id, text="⏹ tracemalloc خاموش شد." if stopped else "tracemalloc روشن نیست.")
+        return
+    report = await run_bg(profiling.memory_snapshot)
+    try:
+        await _send_admin_file(context.bot, user.id, report.encode("utf-8"), f"memsnap-{time.strftime('%Y%m%d-%H%M%S')}.txt", "🧠 tracemalloc")
+        if chat_id != user.id:
+            await context.bot.send_message(chat_id=chat_id, text="✅ نتیجه به دایرکت شما ارسال شد.")
+    except Exception:
+        await context.bot.send_message(chat_id=chat_id, text="⚠️ ارسال به دایرکت ممکن نشد؛ اول ربات را در خصوصی استارت کنید.")
+
+
+# ---------- پیام همگانی (ادمین) ----------
+broadcast_session: dict = {"task": None, "sender": None}
+
+
+async def broadcast_targets(include_idle: bool) -> list:
+    games = dict(state.get("games", {}))
+    if SHARD_WORKERS > 1:
+        # بازی‌های بقیه‌ی workerها فقط در فایل state خودشان هستند (خواندن روی IO_EXECUTOR)
+        import shard
+        games = {**await run_io(shard.all_games), **games}
+    return [int(cid) for cid, g in games.items() if include_idle or g.get("started")]
+
+
+def format_broadcast(r: dict) -> str:
+    text = f"ارسال‌شده: {r['delivered']}/{r['total']} | ناموفق: {r['failed']} | باقی‌مانده: {r['pending']} | {r['seconds']} ثانیه"
+    if r["errors"]:
+        text += "\nخطاها: " + ", ".join(f"{k}×{v}" for k, v in sorted(r["errors"].items()))
+    return text
+
+
+async def _run_broadcast(bot, chat_id: int, status_id: Optional[int], targets: list, text: str):
+    async def progress(r):
+        if status_id:
+            await bot.edit_message_text(chat_id=chat_id, message_id=status_id, text="📣 در حال ارسال...\n" + format_broadcast(r))
+
+    sender = broadcast.BatchSender(
+        lambda cid: bot.send_message(chat_id=cid, text=text),
+        rate=BROADCAST_RATE, concurrency=BROADCAST_CONCURRENCY,
+        progress=progress, progress_every=BROADCAST_PROGRESS_SECONDS,
+    )
+    broadcast_session["sender"] = sender
+    try:
+        report = await sender.run(targets)
+        title = "⏹ ارسال متوقف شد." if report["stopped"] else "✅ ارسال تمام شد."
+        await bot.send_message(chat_id=chat_id, text=f"{title}\n{format_broadcast(report)}")
+    except Exception:
+        metrics.swallowed()
+    finally:
+        broadcast_session["task"] = None
+        broadcast_session["sender"] = None
+
+
+async def broadcast_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    chat_id = update.effective_chat.id
+    if not is_admin(user.id):
+        await context.bot.send_message(chat_id=chat_id, text="❌ فقط ادمین می‌تواند پیام همگانی بفرستد.")
+        return
+    args = context.args or []
+    if args and args[0] == "stop":
+        if broadcast_session["sender"]:
+            broadcast_session["sender"].stop()
+            await context.bot.send_message(chat_id=chat_id, text="⏹ در حال توقف ارسال...")
+        else:
+            await context.bot.send_message(chat_id=chat_id, text="ارسالی در جریان نیست.")
+        return
+    if broadcast_session["task"]:
+        await context.bot.send_message(chat_id=chat_id, text="⚠️ یک ارسال همگانی از قبل در جریان است (/broadcast stop).")
+        return
+    # متن خام پیام تا خط‌های جدید حفظ شوند
+    raw = (update.effective_message.text or "").split(None, 1)
+    body = raw[1].strip() if len(raw) > 1 else ""
+    include_idle = False
+    if body.split(None, 1)[:1] == ["all"]:
+        include_idle = True
+        body = body[3:].strip()
+    if not body:
+        await context.bot.send_message(chat_id=chat_id, text="مثال: /broadcast متن پیام\n/broadcast all متن (همه‌ی گروه‌ها، نه فقط بازی‌های فعال)\n/broadcast stop")
+        return
+    targets = await broadcast_targets(include_idle)
+    if not targets:
+        await context.bot.send_message(chat_id=chat_id, text="هیچ گروهی برای ارسال نیست.")
+        return
+    status_id = None
+    try:
+        msg = await context.bot.send_message(chat_id=chat_id, text=f"📣 ارسال به {len(targets)} گروه شروع شد...")
+        status_id = msg.message_id
+    except Exception:
+        metrics.swallowed()
+    # در پس‌زمینه تا هندلرهای بازی منتظر نمانند
+    broadcast_session["task"] = asyncio.create_task(_run_broadcast(context.bot, chat_id, status_id, targets, body))
+
+
+# ---------- خروجی داده‌ها (export.py) ----------
+def _read_export(path: str, limit: int) -> Optional[bytes]:
+    if os.path.getsize(path) > limit:
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def export_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    chat_id = update.effective_chat.id
+    args = [a.lower() for a in context.args or []]
+    kind = args[0] if args else ""
+    if kind not in export.KINDS:
+        await context.bot.send_message(chat_id=chat_id, text=(
+            "مثال: /export scores|leaderboards|events [csv|jsonl] [raw]\n"
+            "(خروجی gzip است؛ raw = بدون فشرده‌سازی)\n"
+            "ادمین گروه: leaderboards و events همین گروه"
+        ))
+        return
+    # ادمین کل: همه‌ی داده‌ها؛ ادمین گروه: فقط داده‌های همین گروه
+    if is_admin(user.id):
+        only_chat = None
+    elif kind != "scores" and await is_chat_admin(update, context):
+        only_chat = chat_id
+    else:
+        await context.bot.send_message(chat_id=chat_id, text="❌ فقط ادمین می‌تواند خروجی بگیرد.")
+        return
+    fmt = "jsonl" if "jsonl" in args else "csv"
+    compress = "raw" not in args
+    try:
+        path, count = await run_bg(
+            export.export_file, kind, SCORE_DB, fmt, compress, only_chat, 0,
+            (SCORE_TRUTH, SCORE_DARE, PENALTY_NO_ANSWER),
+        )
+    except Exception:
+        metrics.swallowed()
+        await context.bot.send_message(chat_id=chat_id, text="⚠️ ساخت خروجی ناموفق بود.")
+        return
+    try:
+        # InputFile فایل را یک‌جا می‌خواند؛ خواندن در ترد جدا و فقط تا سقف کوچک
+        data = await run_bg(_read_export, path, EXPORT_SEND_MAX_BYTES)
+        if data is None:
+            limit = EXPORT_SEND_MAX_BYTES // (1024 * 1024)
+            await context.bot.send_message(chat_id=chat_id, text=f"⚠️ خروجی بیشتر از {limit} مگابایت است؛ روی سرور با «python3 export.py {kind}» بگیرید.")
+            return
+        await context.bot.send_document(
+            chat_id=user.id, document=data, filename=export.filename(kind, fmt, compress),
+            caption=f"📤 {kind}: {count} سطر",
+        )
+        if chat_id != user.id:
+            await context.bot.send_message(chat_id=chat_id, text="✅ خروجی به دایرکت شما ارسال شد.")
+    except Exception:
+        await context.bot.send_message(chat_id=chat_id, text="⚠️ ارسال به دایرکت ممکن نشد؛ اول ربات را در خصوصی استارت کنید.")
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            metrics.swallowed()
+
+
 # ---------- جریان اصلی بازی ----------
 async def do_next_turn(chat_id: int, context: ContextTypes.DEFAULT_TYPE):
     init_game(chat_id)
@@ -527,7 +1463,7 @@ async def do_next_turn(chat_id: int, context: ContextTypes.DEFAULT_TYPE):
         try:
             await context.bot.send_message(chat_id=chat_id, text="هیچ بازیکنی نیست. بازی متوقف می‌شود.")
         except Exception:
-            pass
+            metrics.swallowed()
         g["started"] = False
         save_state()
         return
@@ -540,7 +1476,10 @@ async def do_next_turn(chat_id: int, context: ContextTypes.DEFAULT_TYPE):
     g["change_count"].setdefault(str(pid), 0)
     g["awaiting"] = True
     g["current_question"] = ""
+    g["current_qref"] = None
     g["current_type"] = ""
+    g["asked_at"] = None
+    g["turn_timeout"] = timeout = turn_timeout(g, pid)
     save_state()
 
     # get mention name
@@ -552,6 +1491,8 @@ async def do_next_turn(chat_id: int, context: ContextTypes.DEFAULT_TYPE):
 
     # group prompt (store id so we can delete/edit later)
     group_text = f"👤 نوبت: {mention_html(pid, mention_name)}\nشرکت‌کنندگان: {len(g['players'])}\nنوع سوال: انتخاب کنید (حقیقت/جرأت)\n(فقط {mention_name} می‌تونه انتخاب کنه)"
+    if auto_skipping(g, pid):
+        group_text += f"\n⚡ چند نوبت پشت سر هم جواب نداده؛ فقط {timeout:g} ثانیه فرصت دارد."
     kb = InlineKeyboardMarkup(
         [[InlineKeyboardButton("حقیقت (پسر/دختر)", callback_data=f"choose|truth|{pid}"),
           InlineKeyboardButton("جرأت (پسر/دختر)", callback_data=f"choose|dare|{pid}")]]
@@ -561,7 +1502,7 @@ async def do_next_turn(chat_id: int, context: ContextTypes.DEFAULT_TYPE):
         g["last_group_msg_id"] = msg.message_id
         save_state()
     except Exception:
-        pass
+        metrics.swallowed()
 
     # cancel previous watcher
     prev = current_tasks.get(chat_id)
@@ -569,16 +1510,18 @@ async def do_next_turn(chat_id: int, context: ContextTypes.DEFAULT_TYPE):
         try:
             prev.cancel()
         except Exception:
-            pass
+            metrics.swallowed()
 
     async def watcher(target_pid: int):
         try:
-            await asyncio.sleep(TURN_TIMEOUT)
-            load_state()
+            await asyncio.sleep(timeout)
             g_local = state.get("games", {}).get(str(chat_id))
             if g_local and g_local.get("started") and g_local.get("awaiting") and g_local.get("players") and g_local.get("players")[g_local.get("idx")] == target_pid:
                 state["games"][str(chat_id)]["awaiting"] = False
+                question_feedback(g_local, FEEDBACK_TIMEOUT)
                 add_score(target_pid, PENALTY_NO_ANSWER)
+                record_stats(chat_id, target_pid, timeouts=1)
+                note_timeout(g_local, target_pid)
                 save_state()
                 try:
                     member2 = await context.bot.get_chat_member(chat_id, target_pid)
@@ -592,7 +1535,7 @@ async def do_next_turn(chat_id: int, context: ContextTypes.DEFAULT_TYPE):
                         parse_mode=ParseMode.HTML
                     )
                 except Exception:
-                    pass
+                    metrics.swallowed()
                 await asyncio.sleep(0.3)
                 st2 = state  # already loaded/saved
                 g2 = st2.get("games", {}).get(str(chat_id))
@@ -654,7 +1597,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             try:
                 await context.bot.send_message(chat_id=chat_id, text="خطا در وضعیت بازی.")
             except Exception:
-                pass
+                metrics.swallowed()
             return
         # only the current player can choose
         if user.id != cur or target != cur:
@@ -665,7 +1608,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 try:
                     await context.bot.send_message(chat_id=chat_id, text="❌ نوبت شما نیست.")
                 except Exception:
-                    pass
+                    metrics.swallowed()
             return
 
         # delete the group prompt so it can't be pressed again
@@ -676,7 +1619,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     g["last_group_msg_id"] = None
                     save_state()
         except Exception:
-            pass
+            metrics.swallowed()
 
         # ask gender category
         if _type == "truth":
@@ -711,14 +1654,21 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await context.bot.send_message(chat_id=chat_id, text="❌ نوبت شما نیست.")
             return
 
-        q = get_random_question(qtype, avoid=g.get("current_question", ""))
-        if not q:
+        drawn = await draw_question(qtype, avoid=g.get("current_question", ""), chat_id=chat_id, uid=cur)
+        if not drawn:
             await context.bot.send_message(chat_id=chat_id, text="سوال موجود نیست؛ ادمین لطفا فایل سوال ها را کامل کند.")
             return
 
+        q, g["current_qref"] = drawn
         g["current_question"] = q
         g["current_type"] = qtype
+        g["asked_at"] = time.time()
         g["awaiting"] = True
+        if auto_skipping(g, cur):
+            # انتخاب کرد، پس حاضر است: مهلت عادی برای پاسخ
+            g["missed"].pop(str(cur), None)
+            g["turn_timeout"] = turn_timeout(g, cur)
+        timeout = g.get("turn_timeout", TURN_TIMEOUT)
         save_state()
 
         group_kb = InlineKeyboardMarkup([
@@ -730,7 +1680,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         try:
             msg = await context.bot.send_message(
                 chat_id=chat_id,
-                text=f"📝 سوال برای {mention_html(target, mention_name)}:\n\n{q}\n\n⏳ {TURN_TIMEOUT} ثانیه فرصت دارید.",
+                text=f"📝 سوال برای {mention_html(target, mention_name)}:\n\n{q}\n\n⏳ {timeout:g} ثانیه فرصت دارید.",
                 reply_markup=group_kb,
                 parse_mode=ParseMode.HTML
             )
@@ -740,23 +1690,25 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             try:
                 await context.bot.send_message(chat_id=chat_id, text=f"📝 سوال:\n{q}", reply_markup=group_kb)
             except Exception:
-                pass
+                metrics.swallowed()
         # restart watcher: cancel previous and start fresh
         prev = current_tasks.get(chat_id)
         if prev:
             try:
                 prev.cancel()
             except Exception:
-                pass
+                metrics.swallowed()
 
         async def watcher_now(target_pid: int):
             try:
-                await asyncio.sleep(TURN_TIMEOUT)
-                load_state()
+                await asyncio.sleep(timeout)
                 g_local = state.get("games", {}).get(str(chat_id))
                 if g_local and g_local.get("started") and g_local.get("awaiting") and g_local.get("players") and g_local.get("players")[g_local.get("idx")] == target_pid:
                     state["games"][str(chat_id)]["awaiting"] = False
+                    question_feedback(g_local, FEEDBACK_TIMEOUT)
                     add_score(target_pid, PENALTY_NO_ANSWER)
+                    record_stats(chat_id, target_pid, timeouts=1)
+                    note_timeout(g_local, target_pid)
                     save_state()
                     try:
                         member2 = await context.bot.get_chat_member(chat_id, target_pid)
@@ -766,7 +1718,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     try:
                         await context.bot.send_message(chat_id=chat_id, text=f"⏱ {mention_html(target_pid, mname)} فرصت پاسخ را از دست داد — {PENALTY_NO_ANSWER} امتیاز کسر شد.", parse_mode=ParseMode.HTML)
                     except Exception:
-                        pass
+                        metrics.swallowed()
                     await asyncio.sleep(0.3)
                     st2 = state
                     g2 = st2.get("games", {}).get(str(chat_id))
@@ -790,7 +1742,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             try:
                 await query.answer("این دکمه برای شما نیست.", show_alert=True)
             except Exception:
-                pass
+                metrics.swallowed()
             return
 
         # find the game chat id where this user is awaiting
@@ -807,7 +1759,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             try:
                 await query.message.reply_text("خطا: وضعیت بازی پیدا نشد.")
             except Exception:
-                pass
+                metrics.swallowed()
             return
 
         init_game(game_chat_id)
@@ -819,7 +1771,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             try:
                 t.cancel()
             except Exception:
-                pass
+                metrics.swallowed()
             current_tasks.pop(game_chat_id, None)
 
         # handle actions
@@ -828,15 +1780,18 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if qtype.startswith("dare"):
                 add_score(user.id, SCORE_DARE)
                 pts = SCORE_DARE
+                record_response(game_chat_id, user.id, g, dares=1)
             else:
                 add_score(user.id, SCORE_TRUTH)
                 pts = SCORE_TRUTH
+                record_response(game_chat_id, user.id, g, truths=1)
+            question_feedback(g, FEEDBACK_DONE)
             g["awaiting"] = False
             save_state()
             try:
                 await context.bot.send_message(chat_id=game_chat_id, text=f"✅ {mention_html(user.id, user.first_name)} پاسخ داد — +{pts} امتیاز.", parse_mode=ParseMode.HTML)
             except Exception:
-                pass
+                metrics.swallowed()
             # cleanup last group prompt
             try:
                 if g.get("last_group_msg_id"):
@@ -844,26 +1799,28 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     g["last_group_msg_id"] = None
                     save_state()
             except Exception:
-                pass
+                metrics.swallowed()
             await asyncio.sleep(0.2)
             await do_next_turn(game_chat_id, context)
             return
 
         if action == "no":
             add_score(user.id, PENALTY_NO_ANSWER)
+            record_response(game_chat_id, user.id, g, refusals=1)
+            question_feedback(g, FEEDBACK_REFUSE)
             g["awaiting"] = False
             save_state()
             try:
                 await context.bot.send_message(chat_id=game_chat_id, text=f"⛔ {mention_html(user.id, user.first_name)} پاسخ نداد/نخواست — {PENALTY_NO_ANSWER} امتیاز.", parse_mode=ParseMode.HTML)
             except Exception:
-                pass
+                metrics.swallowed()
             try:
                 if g.get("last_group_msg_id"):
                     await context.bot.delete_message(chat_id=game_chat_id, message_id=g["last_group_msg_id"])
                     g["last_group_msg_id"] = None
                     save_state()
             except Exception:
-                pass
+                metrics.swallowed()
             await asyncio.sleep(0.2)
             await do_next_turn(game_chat_id, context)
             return
@@ -874,17 +1831,22 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 try:
                     await context.bot.send_message(chat_id=game_chat_id, text="⚠️ دیگر نمی‌توانید سوال را تغییر دهید.")
                 except Exception:
-                    pass
+                    metrics.swallowed()
                 return
             qtype = g.get("current_type", "")
-            q_new = get_random_question(qtype, avoid=g.get("current_question", ""))
-            if not q_new:
+            drawn = await draw_question(qtype, avoid=g.get("current_question", ""), chat_id=game_chat_id, uid=user.id)
+            if not drawn:
                 try:
                     await context.bot.send_message(chat_id=game_chat_id, text="سوال موجود نیست؛ ادمین تکمیل کند.")
                 except Exception:
-                    pass
+                    metrics.swallowed()
                 return
+            question_feedback(g, FEEDBACK_CHANGE)
+            record_stats(game_chat_id, user.id, changes=1)
+            q_new, g["current_qref"] = drawn
             g["current_question"] = q_new
+            g["asked_at"] = time.time()
+            timeout = g.get("turn_timeout", TURN_TIMEOUT)
             g["change_count"][str(user.id)] = cnt + 1
             save_state()
 
@@ -899,7 +1861,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     await context.bot.edit_message_text(
                         chat_id=game_chat_id,
                         message_id=g["last_group_msg_id"],
-                        text=f"📝 سوال جدید برای {mention_html(user.id, user.first_name)}:\n\n{q_new}\n(تغییر: {g['change_count'][str(user.id)]}/{MAX_CHANGES_PER_TURN})\n⏳ {TURN_TIMEOUT} ثانیه فرصت دارید.",
+                        text=f"📝 سوال جدید برای {mention_html(user.id, user.first_name)}:\n\n{q_new}\n(تغییر: {g['change_count'][str(user.id)]}/{MAX_CHANGES_PER_TURN})\n⏳ {timeout:g} ثانیه فرصت دارید.",
                         reply_markup=group_kb,
                         parse_mode=ParseMode.HTML
                     )
@@ -909,7 +1871,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 try:
                     await context.bot.send_message(chat_id=game_chat_id, text=f"📝 سوال جدید:\n{q_new}")
                 except Exception:
-                    pass
+                    metrics.swallowed()
 
             # restart watcher
             prev = current_tasks.get(game_chat_id)
@@ -917,16 +1879,18 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 try:
                     prev.cancel()
                 except Exception:
-                    pass
+                    metrics.swallowed()
 
             async def restart_watcher():
                 try:
-                    await asyncio.sleep(TURN_TIMEOUT)
-                    load_state()
+                    await asyncio.sleep(timeout)
                     g_local = state.get("games", {}).get(str(game_chat_id))
                     if g_local and g_local.get("started") and g_local.get("awaiting") and g_local.get("players") and g_local.get("players")[g_local.get("idx")] == user.id:
                         state["games"][str(game_chat_id)]["awaiting"] = False
+                        question_feedback(g_local, FEEDBACK_TIMEOUT)
                         add_score(user.id, PENALTY_NO_ANSWER)
+                        record_stats(game_chat_id, user.id, timeouts=1)
+                        note_timeout(g_local, user.id)
                         save_state()
                         try:
                             member2 = await context.bot.get_chat_member(game_chat_id, user.id)
@@ -936,7 +1900,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         try:
                             await context.bot.send_message(chat_id=game_chat_id, text=f"⏱ {mention_html(user.id, mname)} فرصت پاسخ را از دست داد — {PENALTY_NO_ANSWER} امتیاز کسر شد.", parse_mode=ParseMode.HTML)
                         except Exception:
-                            pass
+                            metrics.swallowed()
                         await asyncio.sleep(0.2)
                         st2 = state
                         g2 = st2.get("games", {}).get(str(game_chat_id))
@@ -953,7 +1917,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         await context.bot.send_message(chat_id=update.effective_chat.id, text="عملیات نامشخص یا منقضی شده.")
     except Exception:
-        pass
+        metrics.swallowed()
 
 
 # ---------- دستورات کمکی ----------
@@ -966,34 +1930,131 @@ async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/skip — (ادمین) رد نوبت\n"
         "/remove <user_id> — (ادمین) حذف از بازی\n"
         "/leaderboard — نمایش جدول امتیازات\n"
-        "/myid — گرفتن آیدی عددی شما"
+        "/stats [group] — آمار شما (یا کاربری که به پیامش ریپلای شده) / آمار کل گروه\n"
+        "/myid — گرفتن آیدی عددی شما\n"
+        "/profile [ثانیه|stop] — (ادمین) پروفایل cProfile\n"
+        "/memsnap [stop] — (ادمین) snapshot حافظه (tracemalloc)\n"
+        "/pack <دسته> — (ادمین) کپشن فایل txt/jsonl: پک سوال اختصاصی این گروه\n"
+        "/pack clear <دسته> — (ادمین) حذف پک اختصاصی\n"
+        "/broadcast [all] <متن> — (ادمین) پیام به گروه‌های در حال بازی (all: همه) | /broadcast stop\n"
+        "/export scores|leaderboards|events [csv|jsonl] [raw] — (ادمین) خروجی gzip در دایرکت"
     ))
 
 
 # ---------- بوت و هندلرها ----------
-def main():
-    load_state()
-    ensure_data_folder()
-    ensure_question_files()
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+# نام دستور -> هندلر (replay.py هم از همین استفاده می‌کند)
+COMMANDS = {
+    "start": start_cmd,
+    "help": help_cmd,
+    "myid": myid_cmd,
+    "join": join_cmd,
+    "leave": leave_cmd,
+    "startgame": startgame_cmd,
+    "stopgame": stopgame_cmd,
+    "skip": skip_cmd,
+    "remove": remove_cmd,
+    "leaderboard": leaderboard_cmd,
+    "stats": stats_cmd,
+    "profile": profile_cmd,
+    "memsnap": memsnap_cmd,
+    "pack": pack_cmd,
+    "broadcast": broadcast_cmd,
+    "export": export_cmd,
+}
+
+
+def callback_action(update: Update) -> str:
+    data = update.callback_query.data if update.callback_query else None
+    return (data or "").split("|")[0] or "unknown"
+
+
+def register_handlers(app):
+    # ضبط آپدیت‌ها قبل از بقیه هندلرها
+    if RECORD_UPDATES:
+        app.add_handler(TypeHandler(Update, record_update), group=-1)
 
     # commands
-    app.add_handler(CommandHandler("start", start_cmd))
-    app.add_handler(CommandHandler("help", help_cmd))
-    app.add_handler(CommandHandler("myid", myid_cmd))
-    app.add_handler(CommandHandler("join", join_cmd))
-    app.add_handler(CommandHandler("leave", leave_cmd))
-    app.add_handler(CommandHandler("startgame", startgame_cmd))
-    app.add_handler(CommandHandler("stopgame", stopgame_cmd))
-    app.add_handler(CommandHandler("skip", skip_cmd))
-    app.add_handler(CommandHandler("remove", remove_cmd))
-    app.add_handler(CommandHandler("leaderboard", leaderboard_cmd))
+    for name, handler in COMMANDS.items():
+        app.add_handler(CommandHandler(name, metrics.timed_handler("command", name, handler)))
+
+    # فایل پک با کپشن /pack
+    app.add_handler(MessageHandler(
+        filters.Document.ALL & filters.CaptionRegex(r"^/pack(@\w+)?(\s|$)"),
+        metrics.timed_handler("command", "pack", pack_cmd),
+    ))
+
+    # تغییر ادمین‌های گروه (کش chat_admins)
+    app.add_handler(ChatMemberHandler(
+        metrics.timed_handler("chat_member", "chat_member", chat_member_update), ChatMemberHandler.CHAT_MEMBER,
+    ))
 
     # callback queries (همه دکمه‌ها)
-    app.add_handler(CallbackQueryHandler(callback_handler))
+    app.add_handler(CallbackQueryHandler(metrics.timed_handler("callback", callback_action, callback_handler)))
+
+
+async def start_watchdog(app):
+    if LOOP_LAG_WARN_SECONDS:
+        app.bot_data["watchdog"] = metrics.LoopWatchdog(LOOP_LAG_WARN_SECONDS).start()
+
+
+async def post_init(app):
+    await start_watchdog(app)
+    app.bot_data["rebuild_weights"] = asyncio.create_task(rebuild_weights_loop())
+    app.bot_data["prune_events"] = asyncio.create_task(prune_events_loop())
+
+
+def build_application(polling: bool = True):
+    builder = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .request(metrics.InstrumentedRequest(connection_pool_size=256))
+        .post_init(post_init)
+    )
+    if not polling:
+        # آپدیت‌ها از روتر shard.py می‌آیند
+        builder = builder.updater(None)
+    app = builder.build()
+    register_handlers(app)
+    return app
+
+
+def start_metrics(port: int):
+    if not port:
+        return
+    try:
+        metrics.serve(port, METRICS_HOST)
+        print(f"Metrics on http://{METRICS_HOST}:{port}/metrics")
+    except OSError as e:
+        print(f"Metrics endpoint disabled: {e}")
+
+
+def flush_state():
+    # نوشتن‌های در صف را تمام کن و state نهایی و وزن‌های ذخیره‌نشده را ذخیره کن
+    IO_EXECUTOR.shutdown(wait=True)
+    _write_state(json.dumps(state, ensure_ascii=False, indent=2))
+    for key, qw in weights_cache.items():
+        if qw.dirty:
+            _save_weights(key, qw.n, qw.sig, qw.weights.tobytes())
+
+
+def main():
+    if SHARD_WORKERS > 1:
+        import shard
+        shard.run(SHARD_WORKERS)
+        return
+
+    load_state()
+    ensure_data_folder()
+    ensure_question_files()
+    questions.compile_stale(FILES)
+    open_score_store()
+    app = build_application()
+    start_metrics(METRICS_PORT)
 
     print("Bot started")
-    app.run_polling()
+    # chat_member به صورت پیش‌فرض فرستاده نمی‌شود
+    app.run_polling(allowed_updates=Update.ALL_TYPES)
+    flush_state()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,236 @@
+# metrics.py
+# متریک‌های ساده با خروجی متنی Prometheus (بدون وابستگی اضافه).
+# main.py در صورت تنظیم METRICS_PORT یک endpoint روی /metrics باز می‌کند.
+import asyncio
+import math
+import sys
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telegram.request import HTTPXRequest
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+_registry: dict = {}  # name -> metric؛ ثبت دوباره با همان نام جایگزین می‌شود
+_lock = threading.Lock()
+
+
+def percentile(values, pct: float) -> float:
+    """صدک nearest-rank روی نمونه‌های خام (replay/loadtest و مهلت نوبت main.py)."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[max(0, math.ceil(pct / 100.0 * len(values)) - 1)]
+
+
+def _labels_text(names, values) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for n, v in zip(names, values):
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{n}="{v}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _fmt(v) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labels=()):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self.values: dict = {}
+        _registry[name] = self
+
+    def inc(self, *label_values, amount=1):
+        with _lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.doc}"
+        yield f"# TYPE {self.name} counter"
+        for lv, v in sorted(self.values.items()):
+            yield f"{self.name}{_labels_text(self.labels, lv)} {_fmt(v)}"
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self.values: dict = {}  # labels -> [bucket counts..., sum, count]
+        _registry[name] = self
+
+    def observe(self, value, *label_values):
+        with _lock:
+            row = self.values.get(label_values)
+            if row is None:
+                row = self.values[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    row[i] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.doc}"
+        yield f"# TYPE {self.name} histogram"
+        for lv, row in sorted(self.values.items()):
+            acc = 0
+            for b, n in zip(self.buckets, row):
+                acc += n
+                yield f"{self.name}_bucket{_labels_text(self.labels + ('le',), lv + (_fmt(b),))} {acc}"
+            yield f"{self.name}_sum{_labels_text(self.labels, lv)} {_fmt(row[-2])}"
+            yield f"{self.name}_count{_labels_text(self.labels, lv)} {row[-1]}"
+
+
+class Gauge:
+    """مقدار لحظه‌ای که هنگام scrape از تابع fn خوانده می‌شود."""
+
+    def __init__(self, name: str, doc: str, fn):
+        self.name, self.doc, self.fn = name, doc, fn
+        _registry[name] = self
+
+    def render(self):
+        yield f"# HELP {self.name} {self.doc}"
+        yield f"# TYPE {self.name} gauge"
+        try:
+            yield f"{self.name} {_fmt(self.fn())}"
+        except Exception:
+            pass
+
+
+# ---------- متریک‌های ربات ----------
+handler_latency = Histogram("bot_handler_seconds", "Handler latency by command or callback action.", ("kind", "name"))
+handler_errors = Counter("bot_handler_errors_total", "Exceptions raised out of handlers.", ("kind", "name"))
+save_state_seconds = Histogram("bot_save_state_seconds", "Duration of state file writes.")
+save_state_bytes = Histogram("bot_save_state_bytes", "Bytes written per state file write.", buckets=BYTE_BUCKETS)
+api_latency = Histogram("bot_api_request_seconds", "Bot API request latency by method.", ("method",))
+api_calls = Counter("bot_api_requests_total", "Bot API requests by method.", ("method",))
+api_errors = Counter("bot_api_errors_total", "Failed Bot API requests by method.", ("method",))
+loop_lag = Histogram("bot_event_loop_lag_seconds", "Event-loop scheduling delay.")
+swallowed_exceptions = Counter("bot_swallowed_exceptions_total", "Exceptions caught and ignored, by function.", ("site",))
+
+
+def swallowed():
+    """در بلوک‌های `except Exception` صدا زده می‌شود؛ نام تابع صدازننده برچسب می‌شود."""
+    swallowed_exceptions.inc(sys._getframe(1).f_code.co_name)
+
+
+def timed_handler(kind: str, name, handler):
+    """handler را می‌پوشاند تا زمان اجرا ثبت شود. name می‌تواند تابعی از update باشد."""
+    async def wrapper(update, context):
+        label = name(update) if callable(name) else name
+        t0 = time.perf_counter()
+        try:
+            return await handler(update, context)
+        except Exception:
+            handler_errors.inc(kind, label)
+            raise
+        finally:
+            handler_latency.observe(time.perf_counter() - t0, kind, label)
+    return wrapper
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest که تعداد، زمان و خطای هر متد Bot API را ثبت می‌کند."""
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        api_method = url.rstrip("/").rsplit("/", 1)[-1]
+        api_calls.inc(api_method)
+        t0 = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, request_data, *args, **kwargs)
+        except Exception:
+            api_errors.inc(api_method)
+            raise
+        finally:
+            api_latency.observe(time.perf_counter() - t0, api_method)
+        if code >= 400:
+            api_errors.inc(api_method)
+        return code, payload
+
+
+class LoopWatchdog:
+    """تاخیر زمان‌بندی event loop را اندازه می‌گیرد.
+
+    یک کوروتین هر interval ثانیه ضربان می‌زند؛ یک ترد جدا اگر ضربان بیشتر از threshold
+    عقب بیفتد، استک ترد event loop (یعنی همان کدی که loop را بلاک کرده) را چاپ می‌کند.
+    """
+
+    def __init__(self, threshold: float, interval: float = 0.1):
+        self.threshold = threshold
+        self.interval = interval
+        self.last_beat = time.monotonic()
+        self.loop_thread_id = None
+        self.task = None
+        self._stopped = threading.Event()
+
+    async def _beat(self):
+        while True:
+            t0 = time.monotonic()
+            self.last_beat = t0
+            await asyncio.sleep(self.interval)
+            loop_lag.observe(max(0.0, time.monotonic() - t0 - self.interval))
+
+    def _watch(self):
+        reported = False
+        while not self._stopped.wait(self.interval):
+            stalled = time.monotonic() - self.last_beat - self.interval
+            if stalled <= self.threshold:
+                reported = False
+                continue
+            if reported:
+                continue
+            reported = True
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "(no frame)\n"
+            print(f"event loop blocked for {stalled:.3f}s; loop thread stack:\n{stack}", file=sys.stderr, flush=True)
+
+    def start(self):
+        self.loop_thread_id = threading.get_ident()
+        self.task = asyncio.get_running_loop().create_task(self._beat())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self.task:
+            self.task.cancel()
+
+
+def render() -> str:
+    lines = []
+    for m in list(_registry.values()):
+        with _lock:
+            lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+def serve(port: int, host: str = "127.0.0.1"):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
@@ -0,0 +1,87 @@
+# profiling.py
+# پروفایل روی پروسه‌ی در حال اجرا (برای دستورات ادمین /profile و /memsnap در main.py).
+import cProfile
+import io
+import marshal
+import pstats
+import time
+import tracemalloc
+from typing import Optional, Tuple
+
+TRACE_FRAMES = 10      # عمق استک ذخیره‌شده برای هر allocation
+TOP_LINES = 40
+
+_profiler: Optional[cProfile.Profile] = None
+_profile_started = 0.0
+_last_snapshot: Optional[tracemalloc.Snapshot] = None
+
+
+def start_profile() -> bool:
+    """cProfile را روشن می‌کند؛ اگر از قبل روشن باشد False."""
+    global _profiler, _profile_started
+    if _profiler is not None:
+        return False
+    _profiler = cProfile.Profile()
+    _profile_started = time.monotonic()
+    _profiler.enable()
+    return True
+
+
+def stop_profile(sort: str = "cumulative") -> Optional[Tuple[str, bytes]]:
+    """پروفایل را متوقف می‌کند و (گزارش متنی pstats, داده‌ی خام .prof) برمی‌گرداند."""
+    global _profiler
+    prof = _profiler
+    if prof is None:
+        return None
+    prof.disable()
+    _profiler = None
+    out = io.StringIO()
+    out.write(f"profiled for {time.monotonic() - _profile_started:.1f}s\n\n")
+    stats = pstats.Stats(prof, stream=out)
+    stats.sort_stats(sort).print_stats(TOP_LINES)
+    stats.sort_stats("tottime").print_stats(TOP_LINES)
+    prof.create_stats()
+    return out.getvalue(), marshal.dumps(prof.stats)
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    # تخصیص‌های خود tracemalloc و import در اختلاف‌ها نیایند
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+
+
+def memory_snapshot(top: int = TOP_LINES) -> str:
+    """اولین بار tracemalloc را روشن می‌کند؛ بعد از آن اختلاف با snapshot قبلی را گزارش می‌دهد."""
+    global _last_snapshot
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACE_FRAMES)
+        _last_snapshot = _snapshot()
+        return "tracemalloc started; send the command again to get a diff."
+    snap = _snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    lines = [f"traced: current {current / 2**20:.2f} MiB, peak {peak / 2**20:.2f} MiB", ""]
+    if _last_snapshot is not None:
+        lines.append(f"top {top} differences since previous snapshot:")
+        for stat in snap.compare_to(_last_snapshot, "lineno")[:top]:
+            lines.append(str(stat))
+        lines.append("")
+    lines.append(f"top {top} allocations (traceback of largest):")
+    stats = snap.statistics("traceback")
+    for stat in stats[:top]:
+        lines.append(f"{stat.size / 1024:.1f} KiB in {stat.count} blocks")
+    if stats:
+        lines.append("")
+        lines.extend(stats[0].traceback.format())
+    _last_snapshot = snap
+    return "\n".join(lines)
+
+
+def stop_memory() -> bool:
+    global _last_snapshot
+    if not tracemalloc.is_tracing():
+        return False
+    tracemalloc.stop()
+    _last_snapshot = None
+    return True
@@ -0,0 +1,362 @@
+# questions.py
+# بانک فشرده‌ی سوال‌ها: نرمال‌سازی متن فارسی، حذف تکراری‌ها و فایل .bank با ایندکس آفست
+# که ربات آن را mmap می‌کند (حافظه و زمان شروع با 100k+ سوال ثابت می‌ماند).
+#
+#   python3 questions.py build                         # ساخت .bank از فایل‌های FILES
+#   python3 questions.py import truth_boy pack.txt     # افزودن یک پک (txt یا jsonl) به بانک
+#   python3 questions.py import truth_boy big.jsonl --replace
+#
+# ساختار فایل .bank (little-endian):
+#   "QBNK" | version:u16 | reserved:u16 | count:u32
+#   hashes: count * u64        (شناسه‌ی پایدار هر سوال)
+#   offsets: (count + 1) * u64 (نسبت به شروع blob)
+#   blob: متن‌های UTF-8 پشت سر هم
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from collections import OrderedDict
+from typing import Iterable, Iterator, Optional, Tuple
+
+MAGIC = b"QBNK"
+VERSION = 1
+HEADER = struct.Struct("<4sHHI")
+BANK_RELOAD_SECONDS = 60    # هر چند ثانیه تغییر فایل .bank چک شود
+
+ZWNJ = "\u200c"
+_CHAR_MAP = str.maketrans({
+    "\u064a": "\u06cc",  # ي عربی -> ی
+    "\u0649": "\u06cc",  # ى -> ی
+    "\u0643": "\u06a9",  # ك عربی -> ک
+    "\u0640": None,      # کشیده (tatweel)
+    "\u200e": None,      # LRM
+    "\u200f": None,      # RLM
+    "\u200d": None,      # ZWJ
+    "\ufeff": None,      # BOM
+    "\u00a0": " ",       # no-break space
+    "\u202f": ZWNJ,      # narrow no-break space که گاهی به جای نیم‌فاصله تایپ می‌شود
+})
+_WS = re.compile(r"\s+")
+_ZWNJ_RUN = re.compile(ZWNJ + "{2,}")
+_ZWNJ_SPACE = re.compile(r" ?" + ZWNJ + r" ?")
+_KEY_DROP = re.compile(r"[\s" + ZWNJ + r".,!?؟،؛:«»\"'()\-]+")
+
+
+def normalize(text: str) -> str:
+    """یکسان‌سازی ی/ک عربی، نیم‌فاصله و فاصله‌ها؛ متن نمایشی را تغییر معنایی نمی‌دهد."""
+    text = text.translate(_CHAR_MAP)
+    text = _WS.sub(" ", text).strip()
+    text = _ZWNJ_RUN.sub(ZWNJ, text)
+    text = _ZWNJ_SPACE.sub(lambda m: " " if " " in m.group(0) else ZWNJ, text)
+    return text.strip(ZWNJ + " ")
+
+
+def dedupe_key(text: str) -> int:
+    """هش 64 بیتی متن نرمال‌شده بدون فاصله/نیم‌فاصله/علائم؛ نسخه‌های تقریباً یکسان یک کلید دارند."""
+    key = _KEY_DROP.sub("", normalize(text))
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def bank_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".bank"
+
+
+# ---------- خواندن بانک ----------
+class QuestionBank:
+    """بانک mmap شده؛ دسترسی به سوال i با O(1) و بدون بارگذاری کل فایل.
+
+    فایل بلافاصله بسته می‌شود (mmap خودش fd را نگه می‌دارد)؛ اگر close صدا زده نشود، mmap با
+    آزاد شدن آخرین ارجاع بسته می‌شود. کش‌ها به همین تکیه می‌کنند، چون ممکن است یک draw هنوز
+    بانکِ خارج‌شده از کش را در دست داشته باشد.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # فایل خالی
+                raise ValueError(f"empty bank: {path}")
+        magic, version, _, count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"not a question bank: {path}")
+        self.count = count
+        self._hashes_at = HEADER.size
+        self._offsets_at = self._hashes_at + 8 * count
+        self._blob_at = self._offsets_at + 8 * (count + 1)
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def nbytes(self) -> int:
+        return self._mm.size()
+
+    def __getitem__(self, i: int) -> str:
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        start, end = struct.unpack_from("<QQ", self._mm, self._offsets_at + 8 * i)
+        return self._mm[self._blob_at + start:self._blob_at + end].decode("utf-8")
+
+    def hash_at(self, i: int) -> int:
+        return struct.unpack_from("<Q", self._mm, self._hashes_at + 8 * i)[0]
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(self.count):
+            yield self[i]
+
+    def close(self):
+        self._mm.close()
+
+
+class BankCache:
+    """یک QuestionBank باز برای هر مسیر؛ اگر فایل عوض شود (import جدید) دوباره باز می‌شود."""
+
+    def __init__(self, reload_seconds: float = BANK_RELOAD_SECONDS):
+        self.reload_seconds = reload_seconds
+        self._banks: dict = {}   # path -> (bank or None, mtime, checked_at)
+
+    def cached(self, path: str) -> Tuple[bool, Optional[QuestionBank]]:
+        """بدون دسترسی به دیسک: (True, bank) اگر کمتر از reload_seconds پیش چک شده."""
+        entry = self._banks.get(path)
+        if entry and time.monotonic() - entry[2] < self.reload_seconds:
+            return True, entry[0]
+        return False, None
+
+    def get(self, path: str) -> Optional[QuestionBank]:
+        """stat و در صورت نیاز باز کردن دوباره؛ بلاک‌کننده (main.py روی IO_EXECUTOR صدا می‌زند)."""
+        now = time.monotonic()
+        entry = self._banks.get(path)
+        if entry and now - entry[2] < self.reload_seconds:
+            return entry[0]
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if entry and entry[1] == mtime:
+            self._banks[path] = (entry[0], mtime, now)
+            return entry[0]
+        bank = None
+        if mtime is not None:
+            try:
+                bank = QuestionBank(path)
+            except (OSError, ValueError, struct.error):
+                bank = None
+        # بانک قبلی بسته نمی‌شود: شاید یک draw هنوز از آن استفاده کند (با GC آزاد می‌شود)
+        self._banks[path] = (bank, mtime, now)
+        return bank
+
+
+def open_bank(path: str) -> Optional[QuestionBank]:
+    """بانک را باز می‌کند؛ اگر نباشد یا خراب باشد None."""
+    try:
+        return QuestionBank(path)
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+class PackCache:
+    """LRU محدود به حجم برای بانک‌های اختصاصی چت‌ها.
+
+    نبودِ پک هم کش می‌شود تا برای چت‌های بدون پک هر بار دیسک چک نشود؛ این‌ها LRU جدا و
+    ارزان (max_missing) دارند تا جای پک‌های واقعی را در max_entries نگیرند.
+    بانک‌های خارج‌شده بسته نمی‌شوند؛ mmap با آزاد شدن آخرین ارجاع بسته می‌شود.
+    """
+
+    def __init__(self, max_bytes: int, max_entries: int, max_missing: int = 65536):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.max_missing = max_missing
+        self.bytes = 0
+        self._items: OrderedDict = OrderedDict()    # key -> (bank, size)
+        self._missing: OrderedDict = OrderedDict()  # key -> None (چت بدون پک)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def lookup(self, key) -> Tuple[bool, Optional[QuestionBank]]:
+        item = self._items.get(key)
+        if item is not None:
+            self._items.move_to_end(key)
+            return True, item[0]
+        if key in self._missing:
+            self._missing.move_to_end(key)
+            return True, None
+        return False, None
+
+    def put(self, key, bank: Optional[QuestionBank]):
+        self.invalidate(key)
+        if bank is None:
+            self._missing[key] = None
+            while len(self._missing) > self.max_missing:
+                self._missing.popitem(last=False)
+            return
+        self._items[key] = (bank, bank.nbytes)
+        self.bytes += bank.nbytes
+        while len(self._items) > 1 and (self.bytes > self.max_bytes or len(self._items) > self.max_entries):
+            self._drop(next(iter(self._items)))
+
+    def invalidate(self, key):
+        self._missing.pop(key, None)
+        if key in self._items:
+            self._drop(key)
+
+    def _drop(self, key):
+        _, size = self._items.pop(key)
+        self.bytes -= size
+
+
+# ---------- ساخت بانک ----------
+def read_pack(path: str) -> Iterator[str]:
+    """سطرهای یک پک را به صورت stream برمی‌گرداند (txt: هر سطر؛ jsonl: فیلد text/question یا رشته)."""
+    jsonl = path.endswith((".jsonl", ".ndjson"))
+    with open(path, "r", encoding="utf-8-sig", errors="replace") as f:
+        for line in f:
+            if jsonl:
+                try:
+                    obj = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(obj, dict):
+                    obj = obj.get("text") or obj.get("question")
+                if not isinstance(obj, str):
+                    continue
+                line = obj
+            yield line
+
+
+def write_bank(path: str, texts: Iterable[str], seen: Optional[set] = None) -> dict:
+    """متن‌ها را نرمال و بدون تکرار در path می‌نویسد (اتمیک). seen کلیدهای از قبل موجود است."""
+    seen = set() if seen is None else seen
+    hashes, offsets = array("Q"), array("Q", [0])
+    total = kept = 0
+    d = os.path.dirname(path) or "."
+    os.makedirs(d, exist_ok=True)
+    with tempfile.TemporaryFile(dir=d) as blob:
+        size = 0
+        for raw in texts:
+            total += 1
+            text = normalize(raw)
+            if not text:
+                continue
+            key = dedupe_key(text)
+            if key in seen:
+                continue
+            seen.add(key)
+            data = text.encode("utf-8")
+            blob.write(data)
+            size += len(data)
+            hashes.append(key)
+            offsets.append(size)
+            kept += 1
+        fd, tmp = tempfile.mkstemp(dir=d, suffix=".bank.tmp")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                out.write(HEADER.pack(MAGIC, VERSION, 0, len(hashes)))
+                out.write(hashes.tobytes() if sys.byteorder == "little" else _swapped(hashes))
+                out.write(offsets.tobytes() if sys.byteorder == "little" else _swapped(offsets))
+                blob.seek(0)
+                while True:
+                    chunk = blob.read(1 << 20)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+    return {"read": total, "kept": kept}
+
+
+def _swapped(a: array) -> bytes:
+    b = array(a.typecode, a)
+    b.byteswap()
+    return b.tobytes()
+
+
+def import_packs(bank: str, packs, replace: bool = False) -> dict:
+    """پک‌ها را به بانک اضافه می‌کند؛ سوال‌های قبلی (و شناسه‌هایشان) اول و بدون تغییر می‌مانند."""
+    existing = None
+    if not replace and os.path.exists(bank):
+        try:
+            existing = QuestionBank(bank)
+        except (ValueError, struct.error):
+            existing = None
+
+    def texts():
+        if existing is not None:
+            yield from existing
+        for p in packs:
+            yield from read_pack(p)
+
+    try:
+        result = write_bank(bank, texts())
+        if existing is not None:
+            # read/kept فقط برای سطرهای پک‌ها، نه سوال‌های از قبل موجود
+            result["read"] -= len(existing)
+            result["kept"] -= len(existing)
+        return result
+    finally:
+        if existing is not None:
+            existing.close()
+
+
+def compile_stale(files: dict) -> list:
+    """برای هر فایل txt که .bank ندارد یا از آن قدیمی‌تر است، بانک را به‌روز می‌کند.
+
+    اگر بانک از قبل هست، سطرهای جدید txt فقط به آخر آن اضافه می‌شوند (مثل import)، تا پک‌های
+    import شده حذف نشوند و شماره‌ی سوال‌ها (bitsetهای seen.py) ثابت بماند. سطری که از txt پاک
+    شود در بانک می‌ماند؛ برای حذف: questions.py import <دسته> <txt> --replace.
+    """
+    built = []
+    for path in files.values():
+        bank = bank_path(path)
+        try:
+            src = os.stat(path).st_mtime_ns
+        except OSError:
+            continue
+        try:
+            if os.stat(bank).st_mtime_ns >= src:
+                continue
+        except OSError:
+            pass
+        import_packs(bank, [path])
+        built.append(bank)
+    return built
+
+
+def cli():
+    import main
+
+    parser = argparse.ArgumentParser(description="compile and import question packs")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("build", help="ساخت/به‌روزرسانی .bank برای همه‌ی FILES")
+    imp = sub.add_parser("import", help="افزودن پک به بانک یک دسته")
+    imp.add_argument("category", choices=sorted(main.FILES))
+    imp.add_argument("packs", nargs="+", help="فایل‌های txt یا jsonl")
+    imp.add_argument("--replace", action="store_true", help="بانک را از نو بساز (شناسه‌ها عوض می‌شوند)")
+    args = parser.parse_args()
+
+    if args.cmd == "build":
+        main.ensure_data_folder()
+        main.ensure_question_files()
+        for bank in compile_stale(main.FILES):
+            print(f"built {bank} ({len(QuestionBank(bank))} questions)")
+        return 0
+    bank = bank_path(main.FILES[args.category])
+    result = import_packs(bank, args.packs, args.replace)
+    print(f"{bank}: read {result['read']}, kept {result['kept']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
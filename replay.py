@@ -0,0 +1,224 @@
+# replay.py
+# اجرای آفلاین آپدیت‌های ضبط‌شده (RECORD_UPDATES در main.py) روی هندلرهای واقعی
+# با یک Bot API جعلی داخل همین پروسه.
+#
+#   python3 replay.py requests.jsonl --speed 20 --json bench_output.json
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+from telegram import Update
+
+import main
+from metrics import percentile
+
+# ---------- Bot API جعلی ----------
+class FakeBot:
+    """جایگزین telegram.Bot: فقط تعداد و زمان فراخوانی‌ها را ثبت می‌کند."""
+
+    def __init__(self, api_latency: float = 0.0):
+        self.api_latency = api_latency
+        self.calls = defaultdict(int)
+        self._next_message_id = 1
+
+    async def _call(self, method: str):
+        self.calls[method] += 1
+        if self.api_latency:
+            await asyncio.sleep(self.api_latency)
+
+    def _message(self, chat_id):
+        mid = self._next_message_id
+        self._next_message_id += 1
+        return SimpleNamespace(message_id=mid, chat=SimpleNamespace(id=chat_id))
+
+    async def send_message(self, chat_id=None, text=None, **kwargs):
+        await self._call("sendMessage")
+        return self._message(chat_id)
+
+    async def send_document(self, chat_id=None, document=None, **kwargs):
+        await self._call("sendDocument")
+        return self._message(chat_id)
+
+    async def edit_message_text(self, text=None, chat_id=None, message_id=None, **kwargs):
+        await self._call("editMessageText")
+        return True
+
+    async def delete_message(self, chat_id=None, message_id=None, **kwargs):
+        await self._call("deleteMessage")
+        return True
+
+    async def answer_callback_query(self, callback_query_id=None, **kwargs):
+        await self._call("answerCallbackQuery")
+        return True
+
+    async def get_chat_member(self, chat_id=None, user_id=None, **kwargs):
+        await self._call("getChatMember")
+        return SimpleNamespace(user=SimpleNamespace(id=user_id, username=None, first_name=str(user_id)))
+
+    async def get_chat_administrators(self, chat_id=None, **kwargs):
+        await self._call("getChatAdministrators")
+        return []
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+
+# ---------- مسیریابی آپدیت‌ها (مثل main.main) ----------
+def route(update: Update):
+    """(نام هندلر, تابع, args) را برمی‌گرداند؛ اگر هندلری نباشد None."""
+    if update.callback_query:
+        action = (update.callback_query.data or "").split("|")[0]
+        return f"callback:{action}", main.callback_handler, []
+    if update.chat_member:
+        return "chat_member", main.chat_member_update, []
+    msg = update.effective_message
+    if msg and msg.text and msg.text.startswith("/"):
+        words = msg.text.split()
+        name = words[0][1:].split("@")[0].lower()
+        handler = main.COMMANDS.get(name)
+        if handler:
+            return f"/{name}", handler, words[1:]
+    return None
+
+
+def load_records(path: str):
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except Exception:
+                continue
+            if isinstance(rec, dict) and isinstance(rec.get("update"), dict):
+                records.append(rec)
+    records.sort(key=lambda r: r.get("ts", 0))
+    return records
+
+
+# ---------- اجرای replay ----------
+async def replay(records, speed: float = 1.0, api_latency: float = 0.0):
+    bot = FakeBot(api_latency)
+    latencies = defaultdict(list)
+    turns = {"count": 0}
+
+    # شمارش نوبت‌ها: هندلرها do_next_turn را از ماژول main صدا می‌زنند
+    real_next_turn = main.do_next_turn
+
+    async def counted_next_turn(chat_id, context):
+        turns["count"] += 1
+        return await real_next_turn(chat_id, context)
+
+    main.do_next_turn = counted_next_turn
+    main.TURN_TIMEOUT = main.TURN_TIMEOUT / speed
+    main.TURN_TIMEOUT_MIN = main.TURN_TIMEOUT_MIN / speed
+    main.AUTO_SKIP_SECONDS = main.AUTO_SKIP_SECONDS / speed
+
+    started = time.perf_counter()
+    first_ts = records[0].get("ts", 0) if records else 0
+    skipped = 0
+    try:
+        for rec in records:
+            # فاصله‌ی زمانی بین آپدیت‌ها با ضریب speed فشرده می‌شود
+            due = (rec.get("ts", first_ts) - first_ts) / speed
+            delay = due - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            update = Update.de_json(rec["update"], bot)
+            routed = route(update) if update else None
+            if not routed:
+                skipped += 1
+                continue
+            name, handler, args = routed
+            context = SimpleNamespace(bot=bot, args=args)
+            t0 = time.perf_counter()
+            try:
+                await handler(update, context)
+            except Exception:
+                latencies[f"{name} (error)"].append(time.perf_counter() - t0)
+                continue
+            latencies[name].append(time.perf_counter() - t0)
+
+        # اجازه بده واچرهای باقی‌مانده یک‌بار تایم‌اوت شوند
+        if main.current_tasks:
+            await asyncio.sleep(main.TURN_TIMEOUT + 0.5)
+    finally:
+        for t in list(main.current_tasks.values()):
+            t.cancel()
+        main.do_next_turn = real_next_turn
+
+    return {
+        "updates": len(records),
+        "skipped": skipped,
+        "wall_seconds": round(time.perf_counter() - started, 3),
+        "turns": turns["count"],
+        "api_calls": dict(bot.calls),
+        "api_calls_total": bot.total_calls,
+        "api_calls_per_turn": round(bot.total_calls / turns["count"], 2) if turns["count"] else None,
+        "handlers": {
+            name: {
+                "count": len(vals),
+                "p50_ms": round(percentile(vals, 50) * 1000, 3),
+                "p90_ms": round(percentile(vals, 90) * 1000, 3),
+                "p99_ms": round(percentile(vals, 99) * 1000, 3),
+                "max_ms": round(max(vals) * 1000, 3),
+            }
+            for name, vals in sorted(latencies.items())
+        },
+    }
+
+
+def print_report(report: dict):
+    print(f"updates: {report['updates']} (skipped {report['skipped']}) in {report['wall_seconds']}s")
+    print(f"turns: {report['turns']}  api calls: {report['api_calls_total']}  per turn: {report['api_calls_per_turn']}")
+    print(f"{'handler':<24}{'count':>7}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}  (ms)")
+    for name, h in report["handlers"].items():
+        print(f"{name:<24}{h['count']:>7}{h['p50_ms']:>10}{h['p90_ms']:>10}{h['p99_ms']:>10}{h['max_ms']:>10}")
+    for method, n in sorted(report["api_calls"].items()):
+        print(f"  {method}: {n}")
+
+
+def cli():
+    parser = argparse.ArgumentParser(description="replay recorded updates against the bot handlers")
+    parser.add_argument("file", help="JSONL ضبط‌شده با RECORD_UPDATES")
+    parser.add_argument("--speed", type=float, default=10.0, help="ضریب فشرده‌سازی زمان (TURN_TIMEOUT و فاصله‌ها)")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="تاخیر شبیه‌سازی‌شده‌ی هر فراخوانی API (ثانیه)")
+    parser.add_argument("--json", dest="json_out", help="ذخیره‌ی گزارش به صورت JSON")
+    args = parser.parse_args()
+
+    records = load_records(os.path.abspath(args.file))
+    if not records:
+        print("no recorded updates found", file=sys.stderr)
+        return 1
+    json_out = os.path.abspath(args.json_out) if args.json_out else None
+
+    # state و فایل‌های سوال در یک پوشه‌ی موقت، تا scores.json واقعی دست نخورد
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        main.state = {"games": {}, "scores": {}}
+        # آیدی‌ها هنگام ضبط ناشناس شده‌اند؛ ادمین هم باید با همان هش شناخته شود
+        main.ADMIN_ID = main._anon_id(int(main.ADMIN_ID))
+        main.ensure_data_folder()
+        main.ensure_question_files()
+        main.questions.compile_stale(main.FILES)
+        main.open_score_store()
+        report = asyncio.run(replay(records, args.speed, args.api_latency))
+
+    print_report(report)
+    if json_out:
+        with open(json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
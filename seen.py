@@ -0,0 +1,81 @@
+# seen.py
+# تاریخچه‌ی سوال‌های دیده‌شده‌ی هر کاربر به صورت bitset روی شماره‌ی سوال در بانک
+# (یک بیت برای هر سوال؛ 100k سوال = 12.5KB برای هر کاربر و دسته).
+import random
+import re
+import struct
+from typing import Optional
+
+_NOT_FULL = re.compile(rb"[^\xff]")   # اولین بایتی که حداقل یک بیت صفر دارد
+SIG = struct.Struct("<QQ")
+
+
+def signature(bank, n: int) -> bytes:
+    """هش سوال اول و سوال n-ام؛ اگر بانک جایگزین شده باشد (نه فقط بزرگ‌تر) عوض می‌شود."""
+    if n <= 0:
+        return SIG.pack(0, 0)
+    return SIG.pack(bank.hash_at(0), bank.hash_at(n - 1))
+
+
+class SeenSet:
+    """bitset با n بیت معتبر؛ بیت‌های اضافه‌ی بایت آخر همیشه 1 هستند تا انتخاب نشوند."""
+
+    __slots__ = ("n", "bits")
+
+    def __init__(self, n: int, bits: Optional[bytes] = None):
+        self.n = 0
+        self.bits = bytearray()
+        if bits:
+            self.n = n
+            self.bits = bytearray(bits[:(n + 7) // 8])
+            self.bits.extend(b"\0" * ((n + 7) // 8 - len(self.bits)))
+            self._pad()
+        else:
+            self.resize(n)
+
+    def _pad(self):
+        tail = self.n % 8
+        if tail:
+            self.bits[-1] |= (0xFF << tail) & 0xFF
+
+    def resize(self, n: int):
+        """بانک بزرگ‌تر شده (import افزایشی): سوال‌های جدید دیده‌نشده‌اند."""
+        if n == self.n:
+            return
+        if n < self.n:
+            self.n = 0
+            self.bits = bytearray()
+        tail = self.n % 8
+        if tail:
+            self.bits[-1] &= (1 << tail) - 1
+        self.bits.extend(b"\0" * ((n + 7) // 8 - len(self.bits)))
+        self.n = n
+        self._pad()
+
+    def __contains__(self, i: int) -> bool:
+        return bool(self.bits[i >> 3] & (1 << (i & 7)))
+
+    def add(self, i: int):
+        self.bits[i >> 3] |= 1 << (i & 7)
+
+    def reset(self):
+        self.bits = bytearray(len(self.bits))
+        self._pad()
+
+    def pick_unseen(self, rng=random) -> Optional[int]:
+        """یک شماره‌ی دیده‌نشده؛ اگر همه دیده شده‌اند None."""
+        if not self.n:
+            return None
+        # معمولاً چند تلاش تصادفی کافی است
+        for _ in range(4):
+            i = rng.randrange(self.n)
+            if i not in self:
+                return i
+        # پیدا کردن بایت غیرپر با regex (حلقه در C) از یک نقطه‌ی تصادفی
+        start = rng.randrange(len(self.bits))
+        m = _NOT_FULL.search(self.bits, start) or _NOT_FULL.search(self.bits, 0, start)
+        if not m:
+            return None
+        byte = self.bits[m.start()]
+        bit = (~byte & (byte + 1)).bit_length() - 1   # پایین‌ترین بیت صفر
+        return m.start() * 8 + bit
@@ -0,0 +1,199 @@
+# shard.py
+# حالت چند-worker: یک روتر getUpdates را می‌خواند و هر آپدیت را بر اساس chat_id
+# (consistent hashing) به پروسه‌ی مالک آن چت می‌فرستد. بازی‌های هر چت فقط در یک worker
+# هستند و امتیازات در SCORE_DB (SQLite) بین همه مشترک است.
+#
+# با SHARD_WORKERS > 1 در main.py فعال می‌شود (Procfile تغییری نمی‌خواهد).
+import asyncio
+import bisect
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import signal
+
+from telegram import Bot, Update
+from telegram.error import InvalidToken, RetryAfter, TelegramError
+
+import main
+from store import ScoreStore
+
+VIRTUAL_NODES = 512
+
+
+class HashRing:
+    """consistent hashing: با اضافه شدن worker فقط حدود 1/n چت‌ها جابه‌جا می‌شوند."""
+
+    def __init__(self, nodes, vnodes: int = VIRTUAL_NODES):
+        points = []
+        for node in nodes:
+            for i in range(vnodes):
+                points.append((self._hash(f"{node}:{i}"), node))
+        points.sort()
+        self._keys = [p[0] for p in points]
+        self._nodes = [p[1] for p in points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def node_for(self, key) -> int:
+        i = bisect.bisect(self._keys, self._hash(str(key))) % len(self._keys)
+        return self._nodes[i]
+
+
+def routing_key(update: Update) -> int:
+    if update.effective_chat:
+        return update.effective_chat.id
+    if update.effective_user:
+        return update.effective_user.id
+    return 0
+
+
+def worker_state_file(index: int) -> str:
+    base, ext = os.path.splitext(main.SCORE_FILE)
+    return f"{base}.worker{index}{ext or '.json'}"
+
+
+def all_games() -> dict:
+    """بازی‌های workerهای فعلی از فایل‌هایشان (برای broadcast)؛ ممکن است چند ثانیه قدیمی باشند.
+
+    فایل workerهایی که دیگر نیستند خوانده نمی‌شود؛ بازی‌هایشان با load_owned_games به مالک جدید رسیده‌اند.
+    """
+    games = {}
+    for i in range(main.SHARD_WORKERS):
+        try:
+            with open(worker_state_file(i), "r", encoding="utf-8") as f:
+                games.update(json.load(f).get("games", {}))
+        except Exception:
+            continue
+    return games
+
+
+def load_owned_games(index: int, ring: HashRing) -> dict:
+    """بازی‌هایی که طبق ring مال این worker هستند، از فایل خودش، بقیه‌ی workerها و scores.json قدیمی.
+
+    اگر تعداد workerها عوض شده باشد، بازی‌های جابه‌جا شده همین‌جا به مالک جدید می‌رسند.
+    """
+    base, ext = os.path.splitext(main.SCORE_FILE)
+    own = worker_state_file(index)
+    paths = [own] + sorted(p for p in glob.glob(f"{base}.worker*{ext or '.json'}") if p != own) + [main.SCORE_FILE]
+    games = {}
+    for path in paths:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            continue
+        for cid, g in data.get("games", {}).items():
+            try:
+                if ring.node_for(int(cid)) == index:
+                    games.setdefault(cid, g)
+            except ValueError:
+                continue
+    return games
+
+
+# ---------- worker ----------
+async def _serve(index: int, queue):
+    app = main.build_application(polling=False)
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, queue.put, None)
+    async with app:
+        await main.post_init(app)
+        await app.start()
+        while True:
+            data = await loop.run_in_executor(None, queue.get)
+            if data is None:
+                break
+            try:
+                await app.update_queue.put(Update.de_json(data, app.bot))
+            except Exception:
+                main.metrics.swallowed()
+        for t in list(main.current_tasks.values()):
+            t.cancel()
+        await app.stop()
+
+
+def worker_main(index: int, workers: int, queue):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # روتر خاموشی را با None اعلام می‌کند
+    main.STATE_FILE = worker_state_file(index)
+    main.score_store = ScoreStore(main.SCORE_DB)
+    main.state = {"games": load_owned_games(index, HashRing(range(workers))), "scores": {}}
+    main.start_metrics(main.METRICS_PORT + index if main.METRICS_PORT else 0)
+    print(f"worker {index}/{workers} started with {len(main.state['games'])} games")
+    asyncio.run(_serve(index, queue))
+    main.flush_state()
+
+
+# ---------- روتر ----------
+async def route_updates(queues, ring: HashRing):
+    offset = None
+    backoff = 1
+    async with Bot(main.BOT_TOKEN) as bot:
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=Update.ALL_TYPES)
+            except RetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+                continue
+            except InvalidToken:
+                raise
+            except TelegramError as e:
+                # مثلاً Conflict وقتی پروسه‌ی قبلی هنوز در حال polling است (هنگام deploy)
+                print(f"router: getUpdates failed ({type(e).__name__}: {e}); retrying in {backoff}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+                continue
+            backoff = 1
+            for u in updates:
+                offset = u.update_id + 1
+                queues[ring.node_for(routing_key(u))].put(u.to_dict())
+
+
+def migrate_legacy_scores():
+    """اولین اجرای چند-worker: امتیازات scores.json به SCORE_DB منتقل می‌شوند."""
+    store = ScoreStore(main.SCORE_DB)
+    if not store.is_empty() or not os.path.exists(main.SCORE_FILE):
+        return
+    try:
+        with open(main.SCORE_FILE, "r", encoding="utf-8") as f:
+            scores = json.load(f).get("scores", {})
+    except Exception:
+        return
+    if scores:
+        store.import_scores(scores)
+        print(f"imported {len(scores)} scores into {main.SCORE_DB}")
+
+
+def run(workers: int):
+    main.ensure_data_folder()
+    main.ensure_question_files()
+    main.questions.compile_stale(main.FILES)
+    migrate_legacy_scores()
+
+    ctx = multiprocessing.get_context("spawn")
+    queues = [ctx.Queue() for _ in range(workers)]
+    procs = [
+        ctx.Process(target=worker_main, args=(i, workers, queues[i]), name=f"worker-{i}")
+        for i in range(workers)
+    ]
+    for p in procs:
+        p.start()
+
+    async def _route():
+        task = asyncio.current_task()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+        await route_updates(queues, HashRing(range(workers)))
+
+    print(f"Bot started ({workers} workers)")
+    try:
+        asyncio.run(_route())
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    finally:
+        for q in queues:
+            q.put(None)
+        for p in procs:
+            p.join(timeout=30)
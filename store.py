@@ -0,0 +1,188 @@
+# store.py
+# داده‌های مشترک بین پروسه‌ها (امتیازات در حالت چند-worker، سوال‌های دیده‌شده، آمار) روی SQLite.
+import sqlite3
+import threading
+import time
+from typing import Iterator, List, Optional, Tuple
+
+
+class _SQLiteStore:
+    """اتصال SQLite جدا برای هر ترد، در حالت WAL تا چند پروسه هم‌زمان بخوانند و بنویسند."""
+
+    SCHEMA: tuple = ()
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            for stmt in self.SCHEMA:
+                conn.execute(stmt)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+
+class ScoreStore(_SQLiteStore):
+    """جدول امتیاز که چند پروسه (حالت چند-worker) هم‌زمان از آن استفاده می‌کنند.
+
+    متدها بلاک‌کننده هستند؛ main.py آن‌ها را روی IO_EXECUTOR صدا می‌زند.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS scores (uid TEXT PRIMARY KEY, score INTEGER NOT NULL DEFAULT 0)",
+        "CREATE INDEX IF NOT EXISTS scores_by_score ON scores (score DESC)",
+    )
+
+    def add(self, uid, amount: int = 1):
+        self._conn().execute(
+            "INSERT INTO scores (uid, score) VALUES (?, ?) "
+            "ON CONFLICT(uid) DO UPDATE SET score = score + excluded.score",
+            (str(uid), amount),
+        )
+
+    def top(self, limit: int = 10) -> List[Tuple[str, int]]:
+        return self._conn().execute(
+            "SELECT uid, score FROM scores ORDER BY score DESC LIMIT ?", (limit,)
+        ).fetchall()
+
+    def is_empty(self) -> bool:
+        return self._conn().execute("SELECT 1 FROM scores LIMIT 1").fetchone() is None
+
+    def iter_all(self) -> Iterator[Tuple[str, int]]:
+        # cursor سطر به سطر می‌خواند؛ حافظه به تعداد کاربران بستگی ندارد
+        return self._conn().execute("SELECT uid, score FROM scores ORDER BY score DESC")
+
+    def import_scores(self, scores: dict):
+        """امتیازات قدیمی scores.json ({"uid": {"score": n}}) را وارد می‌کند."""
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            for uid, info in scores.items():
+                conn.execute(
+                    "INSERT INTO scores (uid, score) VALUES (?, ?) "
+                    "ON CONFLICT(uid) DO UPDATE SET score = score + excluded.score",
+                    (str(uid), int(info.get("score", 0))),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+class SeenStore(_SQLiteStore):
+    """bitset سوال‌های دیده‌شده‌ی هر کاربر برای هر بانک (seen.SeenSet)."""
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS seen ("
+        "uid TEXT NOT NULL, bank TEXT NOT NULL, n INTEGER NOT NULL, sig BLOB NOT NULL, bits BLOB NOT NULL, "
+        "PRIMARY KEY (uid, bank))",
+    )
+
+    def get(self, uid, bank: str) -> Optional[Tuple[int, bytes, bytes]]:
+        return self._conn().execute(
+            "SELECT n, sig, bits FROM seen WHERE uid = ? AND bank = ?", (str(uid), bank)
+        ).fetchone()
+
+    def put(self, uid, bank: str, n: int, sig: bytes, bits: bytes):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO seen (uid, bank, n, sig, bits) VALUES (?, ?, ?, ?, ?)",
+            (str(uid), bank, n, sig, bits),
+        )
+
+
+class WeightStore(_SQLiteStore):
+    """وزن سوال‌های هر بانک (weights.QuestionWeights) به صورت آرایه‌ی float32."""
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS weights (bank TEXT PRIMARY KEY, n INTEGER NOT NULL, sig BLOB NOT NULL, data BLOB NOT NULL)",
+    )
+
+    def get(self, bank: str) -> Optional[Tuple[int, bytes, bytes]]:
+        return self._conn().execute("SELECT n, sig, data FROM weights WHERE bank = ?", (bank,)).fetchone()
+
+    def put(self, bank: str, n: int, sig: bytes, data: bytes):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO weights (bank, n, sig, data) VALUES (?, ?, ?, ?)", (bank, n, sig, data)
+        )
+
+
+class StatsStore(_SQLiteStore):
+    """شمارنده‌های آماده‌ی /stats؛ هر رویداد سه سطر را یک‌جا زیاد می‌کند:
+    کاربر در کل ربات (scope=""), کاربر در این چت و جمع کل چت (uid="*").
+    خود رویداد هم در جدول events می‌ماند (برای export.py) تا prune_events آن را حذف کند."""
+
+    FIELDS = ("truths", "dares", "refusals", "timeouts", "changes", "responses", "resp_ms")
+    EVENTS = {"truths": "truth", "dares": "dare", "refusals": "refuse", "timeouts": "timeout", "changes": "change"}
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS stats (scope TEXT NOT NULL, uid TEXT NOT NULL, "
+        + ", ".join(f"{f} INTEGER NOT NULL DEFAULT 0" for f in FIELDS)
+        + ", PRIMARY KEY (scope, uid)) WITHOUT ROWID",
+        "CREATE TABLE IF NOT EXISTS events (ts REAL NOT NULL, chat TEXT NOT NULL, uid TEXT NOT NULL, "
+        "kind TEXT NOT NULL, resp_ms INTEGER)",
+        "CREATE INDEX IF NOT EXISTS events_by_chat ON events (chat, ts)",
+        "CREATE INDEX IF NOT EXISTS events_by_ts ON events (ts)",
+    )
+
+    def add(self, chat_id, uid, deltas: dict):
+        fields = [f for f in self.FIELDS if deltas.get(f)]
+        if not fields:
+            return
+        sql = (
+            f"INSERT INTO stats (scope, uid, {', '.join(fields)}) VALUES (?, ?{', ?' * len(fields)}) "
+            "ON CONFLICT(scope, uid) DO UPDATE SET "
+            + ", ".join(f"{f} = {f} + excluded.{f}" for f in fields)
+        )
+        values = [int(deltas[f]) for f in fields]
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            for key in (("", str(uid)), (str(chat_id), str(uid)), (str(chat_id), "*")):
+                conn.execute(sql, (*key, *values))
+            kind = next((self.EVENTS[f] for f in fields if f in self.EVENTS), None)
+            if kind:
+                conn.execute(
+                    "INSERT INTO events (ts, chat, uid, kind, resp_ms) VALUES (?, ?, ?, ?, ?)",
+                    (time.time(), str(chat_id), str(uid), kind, deltas.get("resp_ms")),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get(self, scope, uid) -> Optional[dict]:
+        row = self._conn().execute(
+            f"SELECT {', '.join(self.FIELDS)} FROM stats WHERE scope = ? AND uid = ?", (scope, str(uid))
+        ).fetchone()
+        return dict(zip(self.FIELDS, row)) if row else None
+
+    def iter_leaderboards(self, chat_id=None, truth: int = 1, dare: int = 2, penalty: int = -1) -> Iterator[tuple]:
+        """(chat, uid, score, ...FIELDS) برای هر بازیکن در هر چت، به ترتیب امتیاز در آن چت."""
+        where, args = "scope != '' AND uid != '*'", [truth, dare, penalty]
+        if chat_id is not None:
+            where += " AND scope = ?"
+            args.append(str(chat_id))
+        return self._conn().execute(
+            f"SELECT scope, uid, truths * ? + dares * ? + (refusals + timeouts) * ? AS score, {', '.join(self.FIELDS)} "
+            f"FROM stats WHERE {where} ORDER BY scope, score DESC",
+            args,
+        )
+
+    def prune_events(self, before: float) -> int:
+        return self._conn().execute("DELETE FROM events WHERE ts < ?", (before,)).rowcount
+
+    def iter_events(self, chat_id=None, since: float = 0) -> Iterator[tuple]:
+        """(ts, chat, uid, kind, resp_ms) به ترتیب زمان."""
+        if chat_id is not None:
+            return self._conn().execute(
+                "SELECT ts, chat, uid, kind, resp_ms FROM events WHERE chat = ? AND ts >= ? ORDER BY ts",
+                (str(chat_id), since),
+            )
+        return self._conn().execute(
+            "SELECT ts, chat, uid, kind, resp_ms FROM events WHERE ts >= ? ORDER BY rowid", (since,)
+        )
@@ -0,0 +1,98 @@
+# weights.py
+# وزن هر سوال از روی بازخورد بازیکن‌ها (تغییر سوال، پاسخ ندادن، تمام شدن وقت) و
+# نمونه‌گیری O(1) با جدول alias (روش Vose).
+import random
+from array import array
+from typing import Optional
+
+MIN_WEIGHT = 0.05
+MAX_WEIGHT = 1.0
+
+
+class AliasTable:
+    """نمونه‌گیری وزن‌دار O(1)؛ ساختن آن O(n) است و در پس‌زمینه انجام می‌شود."""
+
+    __slots__ = ("n", "prob", "alias")
+
+    def __init__(self, weights):
+        n = len(weights)
+        self.n = n
+        self.prob = array("f", bytes(4 * n))
+        self.alias = array("I", bytes(4 * n))
+        total = float(sum(weights))
+        if n == 0 or total <= 0:
+            for i in range(n):
+                self.prob[i] = 1.0
+            return
+        scaled = [w * n / total for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            (small if scaled[l] < 1.0 else large).append(l)
+        for i in large + small:
+            self.prob[i] = 1.0
+
+    def sample(self, rng=random) -> int:
+        i = int(rng.random() * self.n)
+        return i if rng.random() < self.prob[i] else self.alias[i]
+
+
+class QuestionWeights:
+    """وزن‌های یک بانک + جدول alias ساخته‌شده از آخرین snapshot.
+
+    بازخورد فوراً روی weights اعمال می‌شود و با rejection (نسبت وزن فعلی به وزن snapshot)
+    در نمونه‌گیری لحاظ می‌شود؛ rebuild فقط جدول را به‌روز می‌کند. با build=False جدول ساخته
+    نمی‌شود (main.py آن را در ترد جدا می‌سازد) و تا آن موقع نمونه‌گیری یکنواخت است.
+    """
+
+    def __init__(self, n: int, data: Optional[bytes] = None, sig: bytes = b"", build: bool = True):
+        self.weights = array("f")
+        if data:
+            self.weights.frombytes(data[:4 * n])
+        self.sig = sig
+        self.dirty = False
+        self._snapshot = self._table = None
+        self.resize(n)
+        if build:
+            self.rebuild()
+
+    @property
+    def n(self) -> int:
+        return len(self.weights)
+
+    def resize(self, n: int):
+        if n > len(self.weights):
+            self.weights.extend(array("f", [MAX_WEIGHT]) * (n - len(self.weights)))
+            self.dirty = True
+        elif n < len(self.weights):
+            del self.weights[n:]
+            self.dirty = True
+
+    def feedback(self, i: int, factor: float):
+        if 0 <= i < len(self.weights):
+            w = self.weights[i] * factor
+            self.weights[i] = min(MAX_WEIGHT, max(MIN_WEIGHT, w))
+            self.dirty = True
+
+    def rebuild(self):
+        snapshot = array("f", self.weights)
+        table = AliasTable(snapshot)
+        # جایگزینی هم‌زمان هر دو (در ترد پس‌زمینه ساخته می‌شوند)
+        self._snapshot, self._table = snapshot, table
+
+    def sample(self, rng=random, tries: int = 8) -> int:
+        snapshot, table, weights = self._snapshot, self._table, self.weights
+        n = len(weights)
+        if table is None:
+            return rng.randrange(n)
+        for _ in range(tries):
+            if not table.n:
+                break
+            i = table.sample(rng)
+            if i < n and rng.random() * snapshot[i] <= weights[i]:
+                return i
+        return rng.randrange(n)